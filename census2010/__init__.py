@@ -24,6 +24,8 @@ Excel table.
 
 from .downloader import (download, download_single, download_region,
                          download_indicator, download_range, download_all,
-                         extract_metadata, format_folder, html_to_csv)
-from .augmentation import augment_file
+                         extract_metadata, format_folder, html_to_csv,
+                         html_to_table, BrowserPool, JobLedger)
+from .augmentation import augment_file, augment_folder
+from .store import DatasetStore
 
@@ -2,4 +2,4 @@
 A module that augments indicators that have too few details.
 """
 
-from .augment import augment_file
\ No newline at end of file
+from .augment import augment_file, augment_folder
\ No newline at end of file
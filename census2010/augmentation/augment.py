@@ -2,8 +2,28 @@
 An attempt at uniform augmentation algorythm.
 """
 
+from collections import OrderedDict
+import os
+import re
+from typing import List
+
+import numpy as np
 import pandas as pd
 
+from census2010.utils import (TABLE_FORMATS, ProgressReport, create_folder,
+                              map_in_pool, read_table, read_table_metadata,
+                              write_table)
+from . import config
+
+
+RAYON_FLAGS = ['муниципальный', 'Городские округа']
+# Value columns of an indicator table.
+_SERIES = re.compile(r'^d\d+$')
+
+
+def _is_rayon(munis: pd.Series) -> pd.Series:
+    """Flag the rayon-level records of a `muni` column."""
+    return munis.str.contains('|'.join(RAYON_FLAGS), na=False)
 
 def _add_rayons(df: pd.DataFrame) -> pd.DataFrame:
     """Add a column with rayon information to an indicator.
@@ -11,59 +31,242 @@ def _add_rayons(df: pd.DataFrame) -> pd.DataFrame:
     `ind` is an indicator DataFrame that has at least the following fields:
     - `muni`: str - textual description of municipality (same as gks.ru),
     - `d1`: numeric - actual values of indicator per municipality.
-    Some indicators have additional `d{x}` columns - these are not allowed,
-    the indicator must be "flattened", before it can be added rayon-level 
-    values (because it is not clear which value column to take as rayon value).
+    Additional `d{x}` columns are kept as they are - the rayon-level value
+    is always taken from `d1`.
 
     Assumptions:
     1. indicator has both rayon-level and municipality-level records (though,
        the function will work without the municipality-level (rayon-only ind.)
-    2. rayon-level records are marked by certain strings (see flags dict.)
+    2. rayon-level records are marked by certain strings (see RAYON_FLAGS)
+       Records above the first rayon-level record get no rayon.
     """
     ind = df.copy()
-    ind['rayon'] = ''
-    ind['rayon_v'] = 0
-    flags = ['муниципальный', 'Городские округа']
-    for n in ind.index:
-        curr_muni = ind.loc[n, 'muni']
-        curr_value = ind.loc[n, 'd1']
-        if any([flag in curr_muni for flag in flags]):
-            ind.loc[n, 'rayon'] = curr_muni
-            ind.loc[n, 'rayon_v'] = curr_value
-        else:
-            ind.loc[n, 'rayon'] = ind.loc[n-1, 'rayon']
-            ind.loc[n, 'rayon_v'] = ind.loc[n-1, 'rayon_v']
+    is_rayon = _is_rayon(ind.muni)
+    # every record belongs to the latest rayon-level record above it
+    ind['rayon'] = ind.muni.where(is_rayon).ffill().fillna('')
+    ind['rayon_v'] = ind.d1.where(is_rayon).ffill().fillna(0)
     # Flatten "Городские округа"
     ind.loc[ind.rayon.str.contains('Городские округа'), 'rayon_v'] = ind.d1
     ind.loc[ind.rayon.str.contains('Городские округа'), 'rayon'] = ind.muni
     return ind
 
 
-def update_indicator(src_ind: pd.DataFrame, 
-                     helper_ind: pd.DataFrame) -> pd.DataFrame:
+class RayonIndex:
+    """A helper indicator with every record mapped to its rayon.
+
+    Built once per helper table and reused to augment any number of
+    source indicators of the same oblast:
+    - `rayons`: rayon names, `codes`: the position of the rayon of every
+      helper record in `rayons`,
+    - `ratio`: share of every record in the value of its rayon,
+    - `totals`: rayon-level values of the helper, by rayon name.
+    """
+    def __init__(self, helper_ind: pd.DataFrame):
+        ind = _add_rayons(helper_ind.reset_index(drop=True))
+        self.helper = helper_ind.reset_index(drop=True)
+        self.codes, self.rayons = pd.factorize(ind.rayon)
+        self.ratio = (ind.d1 / ind.rayon_v).to_numpy()
+        self.is_rayon = _is_rayon(ind.muni).to_numpy()
+        self.totals = pd.Series(ind.rayon_v.to_numpy(), index=ind.rayon)
+        self.totals = self.totals.groupby(level=0, sort=False).first()
+
+    def sums(self, values=None) -> pd.Series:
+        """
+        Sum the values (the helper `d1` by default) of the records below
+        every rayon-level record, by rayon name - to check them against
+        `totals`.
+        """
+        values = self.helper.d1 if values is None else values
+        below = ~self.is_rayon
+        sums = np.bincount(self.codes[below],
+                           weights=np.asarray(values, dtype=float)[below],
+                           minlength=len(self.rayons))
+        return pd.Series(sums, index=self.rayons)
+
+    def source_rows(self, src_ind: pd.DataFrame) -> np.ndarray:
+        """
+        Return the position in `src_ind` of the rayon of every helper
+        record, -1 where the source has no such rayon. A rayon listed
+        more than once in the source is taken from its first record.
+        """
+        first = ~src_ind.muni.duplicated().to_numpy()
+        munis = pd.Index(src_ind.muni[first])
+        rows = np.flatnonzero(first)
+        by_rayon = np.append(rows, -1)[munis.get_indexer(self.rayons)]
+        return by_rayon[self.codes]
+
+
+# Rayon indexes of at most `RAYON_INDEX_CACHE_SIZE` helper files, least
+# recently used first: path -> ((mtime, size), index).
+RAYON_INDEX_CACHE_SIZE = 32
+_rayon_indexes = OrderedDict()
+
+
+def rayon_index(helper_filename: str) -> RayonIndex:
+    """
+    Return the `RayonIndex` of a helper table file, built once and
+    rebuilt only when the file has changed. Indexes of the
+    `RAYON_INDEX_CACHE_SIZE` most recently used files are kept.
+    """
+    stat = os.stat(helper_filename)
+    path = os.path.abspath(helper_filename)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _rayon_indexes.get(path)
+    if cached is None or cached[0] != signature:
+        cached = (signature, RayonIndex(read_table(helper_filename)))
+    _rayon_indexes[path] = cached
+    _rayon_indexes.move_to_end(path)
+    while len(_rayon_indexes) > RAYON_INDEX_CACHE_SIZE:
+        _rayon_indexes.popitem(last=False)
+    return cached[1]
+
+def clear_rayon_indexes() -> None:
+    """Drop all cached rayon indexes."""
+    _rayon_indexes.clear()
+
+def update_indicator(src_ind: pd.DataFrame, helper_ind) -> pd.DataFrame:
     """
-    Increase detailisation of source indicator based on helper indicator.
+    Increase detailisation of source indicator based on helper indicator
+    (a DataFrame or its prebuilt `RayonIndex`).
+
+    Every value column (`d1`, `d2`...) of the source is distributed
+    between the municipalities of a rayon by the same helper ratios, in
+    one pass over a (records x series) matrix.
 
     Assumptions:
     1. Both indicators are for the same oblast.
     2. The distribution of values between indicators is similar.
     """
-    hlp_ray = _add_rayons(helper_ind)
-    hlp_ray['ratio'] = hlp_ray.d1 / hlp_ray.rayon_v
-    src_m = hlp_ray.merge(src_ind, how='left', left_on='rayon', 
-                          right_on='muni', suffixes=('', '_src'))
-    src_m.drop(['d1', 'rayon_v', 'muni_src'], axis=1, inplace=True)
-    src_m['d1'] = round(src_m.ratio * src_m.d1_src, 1)
-    src_m.drop(['d1_src', 'ratio', 'rayon'], axis=1, inplace=True)
+    index = helper_ind if isinstance(helper_ind, RayonIndex) \
+        else RayonIndex(helper_ind)
+    rows = index.source_rows(src_ind)
+    src = src_ind.reset_index(drop=True).reindex(rows)
+    series = [x for x in src.columns if _SERIES.match(x)]
+    values = src[series].to_numpy(dtype=float)
+    src_m = index.helper[['muni']].copy()
+    for col in src.columns.drop(['muni'] + series):
+        src_m[col] = src[col].to_numpy()
+    augmented = np.round(index.ratio[:, np.newaxis] * values, 1)
+    for n, col in enumerate(series):
+        src_m[col] = augmented[:, n]
     return src_m
 
 def augment_file(src_filename: str, helper_filename: str,
                  target_filename: str) -> None:
-    """Load indicator file and augment it on helper indicator file."""
-    src_df = pd.read_csv(src_filename, sep=';')
-    hlp_df = pd.read_csv(helper_filename, sep=';')
+    """Load indicator file and augment it on helper indicator file.
+
+    Files may be csv, parquet or feather (by extension); the metadata of
+    the source table is carried over to the target."""
+    src_df = read_table(src_filename)
+    hlp_df = read_table(helper_filename)
     aug_df = update_indicator(src_df, hlp_df)
-    aug_df.to_csv(target_filename, sep=';', index=False)
+    write_table(aug_df, target_filename, read_table_metadata(src_filename))
+
+def _is_region_specific(name: str) -> bool:
+    """Check if an indicator name has a region prefix (e.g. `14_...`)."""
+    return name[:2].isdigit() and name[2:3] == '_'
+
+def _find_table(folder: str, name: str) -> str:
+    """Return the filename of a `name` table in any table format, or None."""
+    for ext in TABLE_FORMATS:
+        filename = os.path.join(folder, name + ext)
+        if os.path.isfile(filename):
+            return filename
+    return None
+
+def _resolve_pairs(augmentations: List[dict],
+                   source_folder: str) -> List[tuple]:
+    """
+    Turn augmentation config entries into (source, helper) table names.
+
+    An entry with region prefixed indicators (`14_wages_govt`) is a single
+    pair; an entry without prefixes (`wages_govt`) is applied to every
+    region that has the source table in `source_folder`. Empty entries
+    are skipped.
+    """
+    names = sorted(os.path.splitext(x)[0] for x in os.listdir(source_folder)
+                   if os.path.splitext(x)[1] in TABLE_FORMATS)
+    pairs = []
+    for entry in augmentations:
+        if not entry:
+            continue
+        source, helper = entry['source_indicator'], entry['helper_indicator']
+        if _is_region_specific(source):
+            pairs.append((source, helper))
+            continue
+        for name in names:
+            if _is_region_specific(name) and name[3:] == source:
+                region = name[:2]
+                helper_name = (helper if _is_region_specific(helper)
+                               else f'{region}_{helper}')
+                pairs.append((name, helper_name))
+    return list(OrderedDict.fromkeys(pairs))
+
+def _augment_group(helper_filename: str, sources: List[tuple]) -> List[tuple]:
+    """
+    Augment several source tables on one helper table, loading the helper
+    only once. `sources` are `(source filename, target filename)` tuples;
+    return a `(code, message)` tuple for each of them instead of raising.
+    """
+    try:
+        index = rayon_index(helper_filename)
+    except Exception as exc:
+        return [(1, f'{type(exc).__name__}: {exc}')] * len(sources)
+    results = []
+    for src_filename, target_filename in sources:
+        try:
+            aug_df = update_indicator(read_table(src_filename), index)
+            write_table(aug_df, target_filename,
+                        read_table_metadata(src_filename))
+            results.append((0, 'augmented'))
+        except Exception as exc:
+            results.append((1, f'{type(exc).__name__}: {exc}'))
+    return results
+
+def augment_folder(source_folder: str, helper_folder: str,
+                   target_folder: str, augmentations: List[dict] = None,
+                   workers: int = None, fmt: str = 'csv') -> List[tuple]:
+    """Augment every source/helper pair of the augmentation config.
+
+    Pairs are resolved across all regions (see `_resolve_pairs`) from
+    `config.augmentations` unless `augmentations` are given, source
+    tables are looked up in `source_folder` and helpers in
+    `helper_folder`, and results are saved to `target_folder` in `fmt`.
+    Pairs sharing a helper table are augmented together so that the
+    helper is loaded once, on `workers` processes (see `map_in_pool`).
+
+    Return `((source, helper), code, message)` tuples in config order,
+    code being 0 (augmented), 1 (error) or 2 (a table is missing)."""
+    augmentations = config.augmentations if augmentations is None \
+        else augmentations
+    pairs = _resolve_pairs(augmentations, source_folder)
+    create_folder(target_folder)
+    progress = ProgressReport(pairs, status={0: 'augmented'})
+    results = [None] * len(pairs)
+    groups = OrderedDict()
+    for index, (source, helper) in enumerate(pairs):
+        src_filename = _find_table(source_folder, source)
+        helper_filename = _find_table(helper_folder, helper)
+        if src_filename is None or helper_filename is None:
+            missing = source if src_filename is None else helper
+            results[index] = (pairs[index], 2, f'No table {missing}')
+            progress.done(index, 2, f'No table {missing}')
+            continue
+        target_filename = os.path.join(target_folder, f'{source}.{fmt}')
+        groups.setdefault(helper_filename, []).append(
+            (index, src_filename, target_filename))
+
+    def finish(group, group_results):
+        for (index, _, _), (code, message) in zip(group, group_results):
+            results[index] = (pairs[index], code, message)
+            progress.done(index, code, message)
+
+    sources = [[x[1:] for x in group] for group in groups.values()]
+    group_results = map_in_pool(_augment_group, list(groups), sources,
+                                workers=workers, chunksize=1)
+    for group, result in zip(groups.values(), group_results):
+        finish(group, result)
+    return results
 
 
 def main():
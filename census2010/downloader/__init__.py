@@ -15,5 +15,15 @@ Downloader subpackage provides tools to:
 
 from .downloader import download, download_single
 from .downloader import download_region, download_range, download_all
-from .downloader import download_indicator
-from .post_process import format_folder, extract_metadata, html_to_csv
+from .downloader import download_indicator, download_all_async
+from .downloader import download_jobs
+from .cache import TableCache
+from .ledger import JobLedger
+from . import plan
+from . import metrics
+from .pool import BrowserPool
+from .retry import RetryPolicy
+from . import templates
+from .post_process import (format_folder, formatted_html, extract_metadata,
+                           html_to_csv)
+from .post_process import html_to_table
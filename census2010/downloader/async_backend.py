@@ -0,0 +1,158 @@
+"""
+Census 2010
+===========
+
+Downloader
+----------
+
+Asyncio backend - the HTTP backend running on an event loop, so that
+many tables are requested concurrently over a small number of keep-alive
+connections.
+
+The form emulation itself is shared with `http_backend`; this module
+only provides the asynchronous transport and job runner.
+"""
+
+import asyncio
+from typing import Callable, List, Tuple
+
+import aiohttp
+
+from . import metrics
+from . import scheduler
+from .http_backend import (REGION_URL, TIMEOUT, FORM_HEADERS, StageError,
+                           _extract_table, _form_body, _indicator_request,
+                           _resolve, _table_request)
+from .retry import DEFAULT_POLICY, RetryPolicy, StageFailed
+
+
+CONCURRENCY = 10
+
+
+class AsyncHttpSession:
+    """
+    An asynchronous HTTP client for the `DBInet.cgi` endpoints. Keeps a
+    pool of at most `limit_per_host` keep-alive connections per host and
+    fetches the indicator page of every region only once.
+    """
+    def __init__(self, limit_per_host: int = CONCURRENCY,
+                 url_template: str = REGION_URL, timeout: float = TIMEOUT):
+        self.url_template = url_template
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self._region_pages = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    def region_url(self, ok2: str) -> str:
+        """Return the URL of a webpage with all indicators for a region."""
+        return self.url_template.format(ok2=ok2)
+
+    async def region_page(self, ok2: str) -> tuple:
+        """Fetch (once) a webpage that contains all indicators for a region."""
+        if ok2 not in self._region_pages:
+            task = asyncio.ensure_future(self.get(self.region_url(ok2)))
+            self._region_pages[ok2] = task
+        try:
+            return await self._region_pages[ok2]
+        except Exception:
+            # do not cache a failure - the next job retries the page
+            self._region_pages.pop(ok2, None)
+            raise
+
+    async def get(self, url: str) -> tuple:
+        """
+        Send a GET request and return the `(content, url)` of the
+        response. Fail on an HTTP error status.
+        """
+        async with self.session.get(url) as response:
+            response.raise_for_status()
+            return (await response.read(), str(response.url))
+
+    async def post(self, url: str, fields: list, encoding: str) -> tuple:
+        """
+        Submit form fields encoded in the encoding of the page and return
+        the `(content, url)` of the response.
+        """
+        async with self.session.post(url, data=_form_body(fields, encoding),
+                                     headers=FORM_HEADERS) as response:
+            response.raise_for_status()
+            return (await response.read(), str(response.url))
+
+
+async def download(session: AsyncHttpSession, indicator: str, region: str,
+                   policy: RetryPolicy = None):
+    """
+    Run through the process of downloading a data table for a specified
+    indicator and specified region. Returns the same `(code, result)`
+    tuples as the Selenium `download()`. Requests are retried under
+    `policy` (`retry.DEFAULT_POLICY` by default).
+    """
+    policy = policy or DEFAULT_POLICY
+    indicator_code, template = _resolve(indicator, region)
+    if template is None:
+        return (2, 'No data')
+    try:
+        try:
+            with metrics.timed('load_region', region, indicator) as event:
+                page, url = await policy.call_async(session.region_page,
+                                                    region)
+                event['bytes'] = len(page)
+        except StageFailed as failure:
+            raise StageError(failure.describe('Region not loaded'))
+        action, fields, encoding = _indicator_request(page, url,
+                                                      indicator_code)
+        try:
+            with metrics.timed('open_form', region, indicator) as event:
+                page, url = await policy.call_async(session.post, action,
+                                                    fields, encoding)
+                event['bytes'] = len(page)
+        except StageFailed as failure:
+            raise StageError(failure.describe('Form not loaded'))
+        action, fields, encoding = _table_request(page, url, template)
+        try:
+            with metrics.timed('launch_table', region, indicator) as event:
+                page, url = await policy.call_async(session.post, action,
+                                                    fields, encoding)
+                event['bytes'] = len(page)
+        except StageFailed as failure:
+            raise StageError(failure.describe('Table not loaded'))
+        return (0, _extract_table(page))
+    except StageError as exc:
+        return (1, str(exc))
+
+async def run_jobs(jobs: List[tuple], worker: Callable,
+                   concurrency: int = CONCURRENCY, rate: float = None,
+                   host: Callable = None,
+                   report: Callable = print) -> List[Tuple[tuple, int, str]]:
+    """
+    Await `worker(job)` for every job with at most `concurrency` jobs in
+    flight and return `(job, code, message)` tuples in the order of
+    `jobs`. Rate limiting and progress reporting work as in
+    `scheduler.run_jobs`.
+    """
+    host = host or (lambda job: None)
+    limiter = scheduler.RateLimiter(rate)
+    progress = scheduler.ProgressReport(jobs, report, scheduler.STATUS)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(index, job):
+        async with semaphore:
+            await asyncio.sleep(limiter.reserve(host(job)))
+            try:
+                code, message = await worker(job)
+            except Exception as exc:
+                code, message = 1, f'{type(exc).__name__}: {exc}'
+        progress.done(index, code, message)
+        return (job, code, message)
+
+    return list(await asyncio.gather(*[run(index, job)
+                                       for index, job in enumerate(jobs)]))
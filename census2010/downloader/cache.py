@@ -0,0 +1,111 @@
+"""
+Census 2010
+===========
+
+Downloader
+----------
+
+Table cache - a content-addressed store of raw downloaded tables.
+
+Tables are stored once per distinct content under their SHA-256
+checksum (`objects/ab/abcdef....html`). An append-only JSONL index maps
+every (region, indicator) pair to the template hash it was fetched
+with, the checksum of the content, its size and the fetch time. A crawl
+can skip pairs whose template has not changed since the last fetch, and
+downstream stages can compare checksums to skip unchanged content.
+"""
+
+from datetime import datetime
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from census2010.utils import create_folder
+
+
+class TableCache:
+    """A content-addressed store of raw tables with a metadata index."""
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.index_filename = os.path.join(directory, 'index.jsonl')
+        self._entries = {}
+        self._lock = threading.Lock()
+        create_folder(os.path.join(directory, 'objects'))
+        if os.path.isfile(self.index_filename):
+            with open(self.index_filename, 'r') as index:
+                for line in index:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[(entry['region'],
+                                       entry['indicator'])] = entry
+
+    def object_path(self, checksum: str) -> str:
+        """Return the filename an object is stored under."""
+        return os.path.join(self.directory, 'objects', checksum[:2],
+                            checksum + '.html')
+
+    def entry(self, region: str, indicator: str) -> dict:
+        """Return the latest index entry of a pair or None."""
+        return self._entries.get((region, indicator))
+
+    def lookup(self, region: str, indicator: str, template_hash: str) -> dict:
+        """
+        Return the index entry of a pair if it was fetched with the same
+        template and its content is still in the store, else None.
+        """
+        entry = self.entry(region, indicator)
+        if entry is None or entry['template'] != template_hash:
+            return None
+        if not os.path.isfile(self.object_path(entry['checksum'])):
+            return None
+        return entry
+
+    def put(self, region: str, indicator: str, template_hash: str,
+            html: str) -> dict:
+        """
+        Store a fetched table and index it. The returned entry has a
+        `changed` flag telling if the content differs from the one
+        stored for the pair before.
+        """
+        content = html.encode('utf-8')
+        checksum = hashlib.sha256(content).hexdigest()
+        path = self.object_path(checksum)
+        if not os.path.isfile(path):
+            create_folder(os.path.dirname(path))
+            temp = f'{path}.{threading.get_ident()}.tmp'
+            with open(temp, 'wb') as obj:
+                obj.write(content)
+            os.replace(temp, path)
+        with self._lock:
+            previous = self.entry(region, indicator)
+            entry = {
+                'region': region,
+                'indicator': indicator,
+                'template': template_hash,
+                'checksum': checksum,
+                'size': len(content),
+                'fetched': datetime.now().isoformat(timespec='seconds')
+            }
+            self._entries[(region, indicator)] = entry
+            with open(self.index_filename, 'a') as index:
+                index.write(json.dumps(entry) + '\n')
+        changed = previous is None or previous['checksum'] != checksum
+        return {**entry, 'changed': changed}
+
+    def read(self, region: str, indicator: str) -> str:
+        """Return the latest stored table of a pair."""
+        entry = self.entry(region, indicator)
+        if entry is None:
+            raise KeyError(f'{region}_{indicator}')
+        with open(self.object_path(entry['checksum']), 'r',
+                  encoding='utf-8') as obj:
+            return obj.read()
+
+    def export(self, region: str, indicator: str, filename: str) -> None:
+        """Copy the latest stored table of a pair to a file."""
+        entry = self.entry(region, indicator)
+        if entry is None:
+            raise KeyError(f'{region}_{indicator}')
+        shutil.copyfile(self.object_path(entry['checksum']), filename)
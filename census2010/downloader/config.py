@@ -883,6 +883,8 @@ templates = {
     }
 }
 
+_region_code_set = frozenset(region_codes)
+
 
 def _calc_template(indicator_name: str, region_code: str) -> dict:
     """
@@ -892,7 +894,7 @@ def _calc_template(indicator_name: str, region_code: str) -> dict:
     """
     if indicator_name not in templates:
         raise ValueError('Unknown indicator')
-    if region_code not in region_codes:
+    if region_code not in _region_code_set:
         raise ValueError('Unknown region code')
     base_template = templates.get(indicator_name, {}).get('default', {})
     over_template = templates.get(indicator_name, {}).get(region_code, {})
@@ -15,19 +15,45 @@ Downloader subpackage provides tools to:
 Main functionality of the *downloader* module.
 """
 
-from datetime import datetime
-from importlib import reload
+import asyncio
+import os
 import time
+from urllib.parse import urlparse
 
 import selenium
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import UnexpectedAlertPresentException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 
 from census2010.utils import create_folder
-from . import config
+from . import async_backend
+from . import http_backend
+from . import metrics
 from . import post_process
+from . import retry
+from . import scheduler
+from . import templates
+from .cache import TableCache
+from .ledger import JobLedger, _template_hash
+from .pool import BrowserPool, _launch_browser
+from .retry import RetryPolicy
 
 
+# Seconds each stage waits for the page to become ready before it fails
+# with a (transient) TimeoutException.
+
+STAGE_TIMEOUTS = {
+    'load_region': 30,
+    'open_folder': 5,
+    'check_indicator': 5,
+    'open_form': 30,
+    'fill_form': 5,
+    'manual_layout': 5,
+    'launch_table': 60,
+    'extract_table': 60
+}
+
 # Request is a data object that holds a variety of attributes that allow
 # for efficient downloading of the indicator/region pair.
 
@@ -41,11 +67,10 @@ class Request:
         Take indicator name and region OK2 code, calculate indicator
         code and template. Store all of that in the object.
         """
-        reload(config)
         self.indicator_name = indicator_name
-        self.indicator_code = config.templates[indicator_name]['id']
+        self.indicator_code = templates.indicator_code(indicator_name)
         self.region = region
-        self.template = config._calc_template(indicator_name, region)
+        self.template = templates.get_template(indicator_name, region)
         self._set_availability()
     
     def _set_availability(self):
@@ -63,14 +88,6 @@ class Request:
 
 # Browser operating functions
 
-def _launch_browser(headless: bool):
-    """Initialize a Selenium webdriver session and return a handler."""
-    chrome_options = Options()
-    if headless:
-        chrome_options.add_argument('--headless')
-    driver = webdriver.Chrome('./chromedriver', options=chrome_options)
-    return driver
-
 def _check_box(chkbox_element):
     """
     Make sure a checkbox is checked regardless of it's initial state.
@@ -96,47 +113,80 @@ def _select_option(select_element, pref_option):
 
 # Request handlers:
 
-def _load_region(driver, request: Request):
-    """Go to a webpage that contains all indicators for a region."""
-    ok2 = request.region
-    url = f'https://rosstat.gov.ru/dbscripts/munst/munst{ok2}/DBInet.cgi'
-    driver.get(url)
+def _region_url(ok2: str) -> str:
+    """Return the URL of a webpage with all indicators for a region."""
+    return http_backend.REGION_URL.format(ok2=ok2)
+
+def _region_host(ok2: str) -> str:
+    """
+    Return the endpoint that serves a region's indicators: the host name
+    and the region's own database (e.g. 'rosstat.gov.ru/munst01').
+    Every region has a separate `DBInet.cgi` database behind one host,
+    so requests are rate limited per endpoint.
+    """
+    url = urlparse(_region_url(ok2))
+    return url.netloc + '/' + url.path.rsplit('/', 2)[-2]
+
+def _wait(driver, timeout: float) -> WebDriverWait:
+    """Return an explicit wait on a driver."""
+    return WebDriverWait(driver, timeout)
+
+def _load_region(driver, request: Request, timeout: float):
+    """
+    Go to a webpage that contains all indicators for a region and wait
+    until its indicator tree is ready.
+    """
+    driver.get(_region_url(request.region))
+    _wait(driver, timeout).until(EC.presence_of_element_located(
+        (By.ID, 'Knopka')))
 
-def _open_folder(driver, request: Request):
+def _open_folder(driver, request: Request, timeout: float):
     """Open a folder (by indicator code), if not already open"""
     element = driver.find_element_by_name(request.indicator_code)
     if not element.is_displayed():
+        checkbox = element
         while element.get_attribute('class') != 'list':
             element = element.find_element_by_xpath('..')
         folder_id = element.get_attribute('id')[:-1]
         driver.find_element_by_id(folder_id).click()
+        _wait(driver, timeout).until(EC.visibility_of(checkbox))
 
-def _check_indicator(driver, request):
+def _check_indicator(driver, request, timeout: float):
     """Check an indicator checkbox on a region page."""
     chk = driver.find_element_by_name(request.indicator_code)
+    _wait(driver, timeout).until(EC.element_to_be_clickable(
+        (By.NAME, request.indicator_code)))
     if not chk.is_selected():
         chk.click()
 
-def _open_form(driver):
+def _open_form(driver, timeout: float):
     """
     Given an indicator cehckbox is selected, click the button to load
-    the attribute form.
+    the attribute form and wait until the form is ready.
     """
-    button = driver.find_element_by_id('Knopka')
+    button = _wait(driver, timeout).until(EC.element_to_be_clickable(
+        (By.ID, 'Knopka')))
     button.click()
+    _wait(driver, timeout).until(EC.presence_of_element_located(
+        (By.NAME, 'STbl')))
 
-def _fill_form(driver, request):
+def _fill_form(driver, request, timeout: float):
     """Fill indicator form fields based on indicator template."""
+    wait = _wait(driver, timeout)
     for key in request.template:
         if request.template[key] == '*':
-            _check_box(driver.find_element_by_name(key+'_chk'))
+            _check_box(wait.until(EC.element_to_be_clickable(
+                (By.NAME, key+'_chk'))))
         else:
-            _select_option(driver.find_element_by_name(key), request.template[key])
+            _select_option(wait.until(EC.presence_of_element_located(
+                (By.NAME, key))), request.template[key])
 
-def _manual_layout(driver, request):
+def _manual_layout(driver, request, timeout: float):
     """Open manual layout section and fill it out."""
-    manual = driver.find_elements_by_id('Manual')[0]
+    wait = _wait(driver, timeout)
+    manual = wait.until(EC.element_to_be_clickable((By.ID, 'Manual')))
     manual.click()
+    wait.until(EC.visibility_of_element_located((By.NAME, 'a_munr')))
     for key in request.template:
         name = '_' + key
         driver.find_elements_by_name(name)[1].click()
@@ -148,10 +198,25 @@ def _manual_layout(driver, request):
     _select_option(driver.find_element_by_name('a_tippos'), '2')
     _select_option(driver.find_element_by_name('a_oktmo'), '3')
 
-def _launch_table(driver):
+def _table_opened(handles: int):
+    """
+    Wait condition: the table window has opened (or an alert popped up,
+    which is returned as well to be dealt with by the caller).
+    """
+    def condition(driver):
+        alert = EC.alert_is_present()(driver)
+        if alert:
+            return alert
+        return len(driver.window_handles) > handles
+    return condition
+
+def _launch_table(driver, timeout: float):
     """Once the form has been filled out, launch the table."""
-    launch_button = driver.find_element_by_name('STbl')
+    handles = len(driver.window_handles)
+    launch_button = _wait(driver, timeout).until(EC.element_to_be_clickable(
+        (By.NAME, 'STbl')))
     launch_button.click()
+    _wait(driver, timeout).until(_table_opened(handles))
     try:
         driver.switch_to.alert
         raise selenium.common.exceptions.UnexpectedAlertPresentException
@@ -169,149 +234,363 @@ def _evaluate_detail(driver):
     if len(data_cells) / len(rayon_cells) < 1.5:
         raise ValueError
 
-def _extract_table(driver):
-    """Extract the table HTML and return it as a string."""
-    out_table = driver.find_element_by_class_name('OutTbl')
+def _extract_table(driver, timeout: float):
+    """
+    Wait for the table to be rendered, extract its HTML and return it as
+    a string.
+    """
+    out_table = _wait(driver, timeout).until(
+        EC.visibility_of_element_located((By.CLASS_NAME, 'OutTbl')))
     return out_table.get_attribute('innerHTML')
 
 # All kinds of downloader functions:
 
-def download(driver, indicator: str, region: str):
+def download(driver, indicator: str, region: str,
+             policy: RetryPolicy = None, timeouts: dict = None,
+             timings: dict = None):
     """
     Run through the process of downloading a data table for a specified
     indicator and specified region.
+
+    Every stage is run under a retry `policy` (`retry.DEFAULT_POLICY` by
+    default): transient failures are retried with backoff, permanent
+    ones fail the download at once. Each stage waits for the page to be
+    ready for at most its `STAGE_TIMEOUTS` seconds (overridden per stage
+    by `timeouts`). If a `timings` dict is given, the latency in seconds
+    of every stage that has run is stored in it; the same timings are
+    emitted as `metrics` events.
     """
+    policy = policy or retry.DEFAULT_POLICY
+    timeouts = {**STAGE_TIMEOUTS, **(timeouts or {})}
+    timings = {} if timings is None else timings
     request = Request(indicator, region)
     if not request.available:
         return (2, 'No data')
-    try:
-        _load_region(driver, request)
-    except:
-        return (1, 'Region not loaded')
-    try:
-        _open_folder(driver, request)
-    except:
-        return (1, 'Folder not found')
-    try:
-        _check_indicator(driver, request)
-    except:
-        return (1, 'Indicator not found')
-    try:
-        _open_form(driver)
-    except:
-        return (1, 'Form not loaded')
-    try:
-        _fill_form(driver, request)
-    except:
-        return (1, 'Form couldn\'t be filled out')
-    try:
-        _manual_layout(driver, request)
-    except:
-        return (1, 'Manual layout failed')
-    try:
-        _launch_table(driver)
-    except selenium.common.exceptions.UnexpectedAlertPresentException:
-        return (1, 'Alert prevented table from loading')
-    try:
-        html = _extract_table(driver)
-    except:
-        return (1, 'Failed to extract table')
-    return (0, html)
+    stages = [
+        ('load_region', _load_region, (driver, request),
+         'Region not loaded'),
+        ('open_folder', _open_folder, (driver, request),
+         'Folder not found'),
+        ('check_indicator', _check_indicator, (driver, request),
+         'Indicator not found'),
+        ('open_form', _open_form, (driver,), 'Form not loaded'),
+        ('fill_form', _fill_form, (driver, request),
+         'Form couldn\'t be filled out'),
+        ('manual_layout', _manual_layout, (driver, request),
+         'Manual layout failed'),
+        ('launch_table', _launch_table, (driver,), 'Table not launched'),
+        ('extract_table', _extract_table, (driver,),
+         'Failed to extract table')
+    ]
+    for name, stage, args, message in stages:
+        start = time.perf_counter()
+        # the size is only known once a stage has succeeded
+        outcome, size = None, None
+        try:
+            result = policy.call(stage, *args, timeouts[name])
+            outcome = 'ok'
+            size = len(result.encode('utf-8')) \
+                if name == 'extract_table' else 0
+        except retry.StageFailed as failure:
+            outcome = type(failure.error).__name__
+            if isinstance(failure.error, UnexpectedAlertPresentException):
+                message = 'Alert prevented table from loading'
+            return (1, failure.describe(message))
+        except Exception as exc:
+            outcome = type(exc).__name__
+            raise
+        finally:
+            timings[name] = time.perf_counter() - start
+            metrics.emit(name, region, indicator, timings[name], size,
+                         outcome or 'error')
+    return (0, result)
 
 def download_single(indicator_name: str, region_code: str, 
-                    save_directory: str):
+                    save_directory: str, pool: BrowserPool = None):
     """A convenience function to download a single indicator without a
-    boilerplate to instantiate a browser."""
-    driver = _launch_browser(False)
-    code, result = download(driver, indicator_name, region_code)
+    boilerplate to instantiate a browser.
+    
+    Without a `pool` a visible browser is started and left open on error
+    so that the failed page can be inspected."""
+    if pool is not None:
+        with pool.session() as driver:
+            code, result = download(driver, indicator_name, region_code)
+    else:
+        driver = _launch_browser(False)
+        code, result = download(driver, indicator_name, region_code)
+        if code != 1:
+            driver.quit()
     if code == 0:
-        driver.quit()
-        create_folder(save_directory)
-        filename = f'{save_directory}/{region_code}_{indicator_name}.html'
-        with open(filename, 'w') as html_file:
-                html_file.write(result)
+        filename = _save_table(save_directory, region_code, indicator_name,
+                               result)
         dp = post_process._get_num_of_data_points(filename)
         print(f'Success {dp} dp.')
     elif code == 1:
         print(f'Error: {result}')
     elif code == 2:
-        driver.quit()
         print(f'Skipped: {result}')
 
-def download_region(region: str, save_directory: str):
-    """Download all indicators for a specified region."""
-    reload(config)
+def _save_table(save_directory: str, region: str, indicator: str,
+                html: str) -> str:
+    """Save a downloaded table to disk and return its filename."""
     create_folder(save_directory)
-    for indicator in config.templates:
-        driver  = _launch_browser(True)
-        ex_code, result = download(driver, indicator, region)
-        if ex_code == 0:
-            filename = f'{save_directory}/{region}_{indicator}.html'
-            with open(filename, 'w') as html_file:
-                html_file.write(result)
-            status = 'Success!'
-            color = ''
-        elif ex_code == 2:
-            status = 'no data'
-            color = '\033[90m'
+    filename = _table_filename(save_directory, region, indicator)
+    with open(filename, 'w') as html_file:
+        html_file.write(html)
+    return filename
+
+def _table_filename(save_directory: str, region: str, indicator: str) -> str:
+    """Return the filename a downloaded table is saved under."""
+    return f'{save_directory}/{region}_{indicator}.html'
+
+def _pending_jobs(jobs: list, save_directory: str, ledger: JobLedger,
+                  cache: TableCache) -> tuple:
+    """
+    Calculate template hashes of (region, indicator) jobs and drop the
+    jobs that `ledger` lists as complete or that `cache` holds a table
+    for, fetched with the same template (the cached table is copied to
+    `save_directory` if it is not there). Return `(jobs, hashes)`.
+    """
+    hashes = {job: _template_hash(templates.get_template(job[1], job[0]))
+              for job in jobs}
+    todo = []
+    for job in jobs:
+        if ledger is not None and ledger.is_complete(*job, hashes[job]):
+            continue
+        if cache is not None and cache.lookup(*job, hashes[job]):
+            filename = _table_filename(save_directory, *job)
+            if not os.path.isfile(filename):
+                create_folder(save_directory)
+                cache.export(*job, filename)
+            continue
+        todo.append(job)
+    if len(todo) < len(jobs):
+        print(f'Skipping {len(jobs) - len(todo)} completed jobs')
+    return (todo, hashes)
+
+def _finish_job(save_directory: str, ledger: JobLedger, cache: TableCache,
+                template_hash: str, job: tuple, code: int,
+                result: str) -> tuple:
+    """
+    Save a downloaded table (unless `cache` shows it is unchanged and
+    already saved), record the job outcome in the ledger and return the
+    `(code, message)` to report.
+    """
+    region, indicator = job
+    size = 0
+    if code == 0:
+        changed = True
+        if cache is not None:
+            changed = cache.put(region, indicator, template_hash,
+                                result)['changed']
+        filename = _table_filename(save_directory, region, indicator)
+        if changed or not os.path.isfile(filename):
+            _save_table(save_directory, region, indicator, result)
+        size = len(result.encode('utf-8'))
+        result = 'Success!' if changed else 'Success! (unchanged)'
+    if ledger is not None:
+        ledger.record(region, indicator, template_hash, code, result, size)
+    return (code, result)
+
+async def _download_jobs_async(jobs: list, save_directory: str,
+                               concurrency: int, rate: float,
+                               ledger: JobLedger, policy: RetryPolicy,
+                               cache: TableCache) -> list:
+    """
+    Download a list of (region, indicator) jobs over HTTP with at most
+    `concurrency` requests in flight and save the obtained tables to a
+    folder.
+    """
+    jobs, hashes = _pending_jobs(jobs, save_directory, ledger, cache)
+    create_folder(save_directory)
+    async with async_backend.AsyncHttpSession(concurrency) as session:
+
+        async def worker(job):
+            code, result = await async_backend.download(session, job[1],
+                                                        job[0], policy)
+            return await asyncio.to_thread(_finish_job, save_directory,
+                                           ledger, cache, hashes[job], job,
+                                           code, result)
+
+        results = await async_backend.run_jobs(
+            jobs, worker, concurrency=concurrency, rate=rate,
+            host=lambda job: _region_host(job[0]))
+    _report_failures(results)
+    return results
+
+def _report_failures(results: list) -> None:
+    """Print the summary of failed jobs, if any."""
+    summary = retry.failure_summary(results)
+    if summary:
+        print(summary)
+
+def _download_jobs(jobs: list, save_directory: str, pool: BrowserPool,
+                   workers: int, rate: float, ledger: JobLedger,
+                   backend: str, policy: RetryPolicy,
+                   cache: TableCache) -> list:
+    """
+    Download a list of (region, indicator) jobs on `workers` concurrent
+    workers and save the obtained tables to a folder.
+
+    `backend` is either 'selenium' (browser sessions drawn from `pool`)
+    or 'http' (direct form submission on an event loop, `workers` being
+    the number of requests in flight). If a `ledger` is given, jobs it
+    lists as complete are skipped and the outcome of every other job is
+    recorded in it. Download stages are retried under `policy`. With a
+    `cache`, jobs whose template has not changed since their table was
+    cached are skipped, and tables are only rewritten if their content
+    has changed.
+
+    The 'http' backend runs its own event loop, so it cannot be used
+    from a coroutine; await `download_all_async` there instead.
+    """
+    if backend == 'http':
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
         else:
-            status = result
-            color = '\033[31m'
-        timestamp = datetime.now().strftime("%T")
-        message = (color + timestamp +' - ' + region + ' - ' + indicator +
-                   ' - ' + status + '\033[0m')
-        print(message)
-        driver.quit()
+            raise RuntimeError('The http backend cannot run inside an '
+                               'event loop, use download_all_async')
+        return asyncio.run(_download_jobs_async(jobs, save_directory,
+                                                workers, rate, ledger,
+                                                policy, cache))
+    if backend != 'selenium':
+        raise ValueError('Unknown backend')
+    jobs, hashes = _pending_jobs(jobs, save_directory, ledger, cache)
+    create_folder(save_directory)
+
+    def worker(job):
+        region, indicator = job
+        if not templates.is_available(indicator, region):
+            # no need to hold a browser session for a pair without data
+            return _finish_job(save_directory, ledger, cache, hashes[job],
+                               job, 2, 'No data')
+        with pool.session() as driver:
+            code, result = download(driver, indicator, region, policy)
+        return _finish_job(save_directory, ledger, cache, hashes[job], job,
+                           code, result)
+
+    def run():
+        results = scheduler.run_jobs(jobs, worker, workers=workers,
+                                     rate=rate,
+                                     host=lambda job: _region_host(job[0]))
+        _report_failures(results)
+        return results
 
-def download_range(save_directory: str, start: str = '01', end: str = '99'):
+    if pool is not None:
+        return run()
+    with BrowserPool(size=workers) as pool:
+        return run()
+
+def download_region(region: str, save_directory: str,
+                    pool: BrowserPool = None, workers: int = 1,
+                    rate: float = None, ledger: JobLedger = None,
+                    backend: str = 'selenium',
+                    policy: RetryPolicy = None,
+                    cache: TableCache = None):
+    """Download all indicators for a specified region.
+    
+    Browser sessions are drawn from `pool`; a pool of `workers` sessions
+    is used if none is given. `rate` limits requests per second, jobs
+    that `ledger` lists as complete are skipped. `backend='http'` submits
+    the forms directly instead of driving a browser. Failed stages are
+    retried under `policy`; pairs that `cache` holds for the current
+    template are not fetched again."""
+    templates.refresh()
+    jobs = [(region, indicator) for indicator in templates.indicators()]
+    return _download_jobs(jobs, save_directory, pool, workers, rate, ledger,
+                          backend, policy, cache)
+
+def download_range(save_directory: str, start: str = '01', end: str = '99',
+                   pool: BrowserPool = None, workers: int = 1,
+                   rate: float = None, ledger: JobLedger = None,
+                   backend: str = 'selenium',
+                   policy: RetryPolicy = None,
+                   cache: TableCache = None):
     """
-    Consequently download every indicator for every oblast and save
-    obtained tables as separate files to a specified folder.
+    Download every indicator for every oblast in a range of regions on
+    `workers` concurrent workers and save obtained tables as separate
+    files to a specified folder.
     """
-    reload(config)
-    start_index = config.region_codes.index(start)
-    end_index = config.region_codes.index(end) + 1
-    for region in config.region_codes[start_index:end_index]:
-        download_region(region, save_directory)
+    templates.refresh()
+    regions = templates.regions()
+    start_index = regions.index(start)
+    end_index = regions.index(end) + 1
+    jobs = [(region, indicator)
+            for region in regions[start_index:end_index]
+            for indicator in templates.indicators()]
+    return _download_jobs(jobs, save_directory, pool, workers, rate, ledger,
+                          backend, policy, cache)
 
 def download_indicator(indicator_name: str, save_directory: str,
-                       start: str = '01', end: str = '99'):
-    """
-    Consequently download tables for a specified indicator across all
-    regions.
-    """
-    reload(config)
-    start_idx = config.region_codes.index(start)
-    end_idx = config.region_codes.index(end) + 1
-    for region in config.region_codes[start_idx:end_idx]:
-        driver  = _launch_browser(True)
-        ex_code, result = download(driver, indicator_name, region)
-        if ex_code == 0:
-            filename = f'{save_directory}/{region}_{indicator_name}.html'
-            with open(filename, 'w') as html_file:
-                html_file.write(result)
-            status = 'Success!'
-            color = '\033[90m'
-        elif ex_code == 2:
-            status = 'skipped'
-            color = ''
-        else:
-            status = result
-            color = '\033[31m'
-        timestamp = datetime.now().strftime("%T")
-        regidx = config.region_codes.index(region)
-        message = (f'{timestamp} - {region} ({regidx}) - {indicator_name} - '
-                   f'{status}')
-        message = color + message + '\033[0m'
-        print(message)
-        driver.quit()
-
-def download_all(save_directory: str, start: str = '01'):
-    """
-    Consequently download every indicator for every oblast and save
+                       start: str = '01', end: str = '99',
+                       pool: BrowserPool = None, workers: int = 1,
+                       rate: float = None, ledger: JobLedger = None,
+                       backend: str = 'selenium',
+                       policy: RetryPolicy = None,
+                       cache: TableCache = None):
+    """
+    Download tables for a specified indicator across all regions on
+    `workers` concurrent workers.
+    """
+    templates.refresh()
+    regions = templates.regions()
+    start_idx = regions.index(start)
+    end_idx = regions.index(end) + 1
+    jobs = [(region, indicator_name)
+            for region in regions[start_idx:end_idx]]
+    return _download_jobs(jobs, save_directory, pool, workers, rate, ledger,
+                          backend, policy, cache)
+
+def download_all(save_directory: str, start: str = '01',
+                 pool: BrowserPool = None, workers: int = 1,
+                 rate: float = None, ledger: JobLedger = None,
+                 backend: str = 'selenium',
+                 policy: RetryPolicy = None,
+                 cache: TableCache = None):
+    """
+    Download every indicator for every oblast on `workers` concurrent
+    workers and save obtained tables as separate files to a
+    specified folder. With a `ledger` a restarted crawl only runs the
+    jobs that have not completed yet.
+    """
+    templates.refresh()
+    return download_range(save_directory, start, templates.regions()[-1],
+                          pool, workers, rate, ledger, backend, policy,
+                          cache)
+
+def download_jobs(jobs: list, save_directory: str,
+                  pool: BrowserPool = None, workers: int = 1,
+                  rate: float = None, ledger: JobLedger = None,
+                  backend: str = 'selenium',
+                  policy: RetryPolicy = None,
+                  cache: TableCache = None):
+    """
+    Download a list of (region, indicator) jobs - e.g. a shard of a crawl
+    plan (see `plan.shard`) - on `workers` concurrent workers and save
     obtained tables as separate files to a specified folder.
     """
-    reload(config)
-    start_index = config.region_codes.index(start)
-    for region in config.region_codes[start_index:]:
-        download_region(region, save_directory)
+    templates.refresh()
+    return _download_jobs([tuple(job) for job in jobs], save_directory,
+                          pool, workers, rate, ledger, backend, policy,
+                          cache)
+
+async def download_all_async(save_directory: str, start: str = '01',
+                             concurrency: int = async_backend.CONCURRENCY,
+                             rate: float = None, ledger: JobLedger = None,
+                             policy: RetryPolicy = None,
+                             cache: TableCache = None):
+    """
+    Download every indicator for every oblast over HTTP with at most
+    `concurrency` requests in flight and save obtained tables as
+    separate files to a specified folder.
+    """
+    templates.refresh()
+    regions = templates.regions()
+    start_index = regions.index(start)
+    jobs = [(region, indicator)
+            for region in regions[start_index:]
+            for indicator in templates.indicators()]
+    return await _download_jobs_async(jobs, save_directory, concurrency,
+                                      rate, ledger, policy, cache)
@@ -0,0 +1,210 @@
+"""
+Census 2010
+===========
+
+Downloader
+----------
+
+HTTP backend - form emulation for downloading indicator tables by
+submitting the `DBInet.cgi` forms directly instead of clicking through
+them in a browser.
+
+The helpers emulate what the Selenium stages do: they read the default
+state of each form from the page, apply the same "clicks" (indicator
+checkbox, template options, manual layout) and build the request that
+submits the result. The table is then cut out of the `OutTbl` element of
+the response. The requests themselves are sent by `async_backend`.
+"""
+
+from urllib.parse import urlencode, urljoin
+
+from bs4 import BeautifulSoup
+
+from . import templates
+
+
+REGION_URL = 'https://rosstat.gov.ru/dbscripts/munst/munst{ok2}/DBInet.cgi'
+TIMEOUT = 60
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+class StageError(Exception):
+    """A download stage failed; the message is what `download()` reports."""
+
+
+# Form emulation helpers
+
+def _form_body(fields: list, encoding: str) -> str:
+    """URL-encode form fields the way a browser does for the page."""
+    return urlencode(fields, encoding=encoding or 'utf-8')
+
+def _soup(page: bytes) -> BeautifulSoup:
+    """
+    Parse a response body as HTML, detecting the page encoding from its
+    `meta` tag (available as `original_encoding` afterwards).
+    """
+    return BeautifulSoup(page, 'html.parser')
+
+def _parent_form(soup: BeautifulSoup, element):
+    """Return the form an element belongs to (or the whole page)."""
+    return element.find_parent('form') or soup
+
+def _form_action(form, url: str) -> str:
+    """Resolve the URL a form is submitted to."""
+    return urljoin(url, form.get('action') or url)
+
+def _option_value(option) -> str:
+    """Return the submitted value of an `option` element."""
+    value = option.get('value')
+    return value if value is not None else option.text
+
+def _form_state(form) -> dict:
+    """
+    Read the default state of a form: a dict of field name to a list of
+    values, as a browser would submit it without any user interaction.
+    Buttons are left out - only the one that is clicked is submitted.
+    """
+    state = {}
+    for field in form.find_all(['input', 'select', 'textarea']):
+        name = field.get('name')
+        if not name or field.has_attr('disabled'):
+            continue
+        if field.name == 'select':
+            values = [_option_value(x) for x in field.find_all('option')
+                      if x.has_attr('selected')]
+        elif field.name == 'textarea':
+            values = [field.text]
+        else:
+            kind = field.get('type', 'text').lower()
+            if kind in ('submit', 'button', 'image', 'reset', 'file'):
+                continue
+            if kind in ('checkbox', 'radio') and not field.has_attr('checked'):
+                continue
+            values = [field.get('value', 'on')]
+        state.setdefault(name, []).extend(values)
+    return state
+
+def _fields(state: dict) -> list:
+    """Flatten a form state into a list of (name, value) pairs."""
+    return [(name, value) for name in state for value in state[name]]
+
+def _button(form, **attrs) -> tuple:
+    """Return the (name, value) pair a clicked submit button sends."""
+    button = form.find(['input', 'button'], attrs=attrs)
+    if button is None:
+        raise LookupError(f'Button {attrs} not found')
+    return (button.get('name', ''), button.get('value', ''))
+
+def _select_options(form, name: str, pref_option) -> list:
+    """
+    Return the values of `select` options whose text matches
+    `pref_option` (a string or a list of strings).
+    """
+    pref_opts = pref_option if isinstance(pref_option, list) else [pref_option]
+    select = form.find('select', attrs={'name': name})
+    if select is None:
+        raise LookupError(f'Select {name} not found')
+    return [_option_value(x) for x in select.find_all('option')
+            if x.text in pref_opts]
+
+def _all_options(form, name: str) -> list:
+    """Return the values of all options of a `select` element."""
+    select = form.find('select', attrs={'name': name})
+    if select is None:
+        raise LookupError(f'Select {name} not found')
+    return [_option_value(x) for x in select.find_all('option')]
+
+def _radio_value(form, name: str, position: int) -> str:
+    """Return the value of the n-th radio button of a group."""
+    radios = form.find_all('input', attrs={'name': name})
+    return radios[position].get('value', 'on')
+
+def _check_value(form, name: str) -> str:
+    """Return the value a checkbox submits when checked."""
+    checkbox = form.find('input', attrs={'name': name})
+    if checkbox is None:
+        raise LookupError(f'Checkbox {name} not found')
+    return checkbox.get('value', 'on')
+
+
+# Request handlers:
+
+def _fill_form(form, state: dict, template: dict) -> None:
+    """Fill indicator form fields based on indicator template."""
+    for key in template:
+        if template[key] == '*':
+            state[key + '_chk'] = [_check_value(form, key + '_chk')]
+            state[key] = _all_options(form, key)
+        else:
+            state[key] = _select_options(form, key, template[key])
+
+def _manual_layout(form, state: dict, template: dict) -> None:
+    """Switch the form to manual layout and fill it out."""
+    manual = form.find(attrs={'id': 'Manual'})
+    if manual is None or not manual.get('name'):
+        raise LookupError('Manual layout not found')
+    state[manual['name']] = [manual.get('value', 'on')]
+    for key in template:
+        state['_' + key] = [_radio_value(form, '_' + key, 1)]
+    # Format order of municiaplity-related columns
+    for position, key in enumerate(['munr', 'tippos', 'oktmo'], 1):
+        state['_' + key] = [_radio_value(form, '_' + key, 2)]
+        state['a_' + key] = _select_options(form, 'a_' + key, str(position))
+
+def _extract_table(page: bytes) -> str:
+    """Extract the table HTML and return it as a string."""
+    out_table = _soup(page).find(class_='OutTbl')
+    if out_table is None:
+        raise StageError('Failed to extract table')
+    return out_table.decode_contents()
+
+def _resolve(indicator: str, region: str) -> tuple:
+    """
+    Return the checkbox name and the resolved template of an
+    indicator/region pair, or `None` as the template if there is no data.
+    """
+    indicator_code = templates.indicator_code(indicator)
+    template = templates.get_template(indicator, region)
+    if template.pop('available') != 'yes':
+        return (indicator_code, None)
+    return (indicator_code, template)
+
+def _indicator_request(page: bytes, url: str, indicator_code: str) -> tuple:
+    """
+    Check an indicator on a region page and return the `(url, fields,
+    encoding)` of the request that loads the indicator form.
+    """
+    try:
+        soup = _soup(page)
+        checkbox = soup.find('input', attrs={'name': indicator_code})
+        if checkbox is None:
+            raise LookupError(indicator_code)
+        form = _parent_form(soup, checkbox)
+        state = _form_state(form)
+        state[indicator_code] = [checkbox.get('value', 'on')]
+        fields = _fields(state) + [_button(form, id='Knopka')]
+    except Exception:
+        raise StageError('Indicator not found')
+    return (_form_action(form, url), fields, soup.original_encoding)
+
+def _table_request(page: bytes, url: str, template: dict) -> tuple:
+    """
+    Fill out an indicator form and return the `(url, fields, encoding)`
+    of the request that launches the table.
+    """
+    try:
+        soup = _soup(page)
+        form = _parent_form(soup, soup.find(attrs={'name': 'STbl'}))
+        state = _form_state(form)
+    except Exception:
+        raise StageError('Form not loaded')
+    try:
+        _fill_form(form, state, template)
+    except Exception:
+        raise StageError('Form couldn\'t be filled out')
+    try:
+        _manual_layout(form, state, template)
+    except Exception:
+        raise StageError('Manual layout failed')
+    fields = _fields(state) + [_button(form, name='STbl')]
+    return (_form_action(form, url), fields, soup.original_encoding)
@@ -0,0 +1,92 @@
+"""
+Census 2010
+===========
+
+Downloader
+----------
+
+Job ledger - a persistent journal of download job outcomes that lets an
+interrupted crawl be restarted without re-fetching the tables it has
+already got.
+
+Every finished job appends one JSON line keyed by region, indicator and
+the hash of the template the table was requested with. A job counts as
+complete once its latest record for the current template hash is
+successful or reports that no data is available, so editing a template
+in `config.py` makes the affected jobs run again.
+"""
+
+from datetime import datetime
+import hashlib
+import json
+import os
+import threading
+from typing import List
+
+
+STATUS = {0: 'done', 1: 'failed', 2: 'no data'}
+
+
+def _template_hash(template: dict) -> str:
+    """Return a short stable hash of a resolved template."""
+    dump = json.dumps(template, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(dump.encode('utf-8')).hexdigest()[:12]
+
+
+class JobLedger:
+    """
+    A JSONL journal of (region, indicator, template hash) job outcomes.
+    Records are appended and flushed as soon as a job finishes; the
+    latest record per key wins when the journal is loaded.
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._records = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(filename):
+            with open(filename, 'r') as journal:
+                for line in journal:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._records[self._key(record)] = record
+
+    @staticmethod
+    def _key(record: dict) -> tuple:
+        return (record['region'], record['indicator'], record['template'])
+
+    def get(self, region: str, indicator: str, template_hash: str) -> dict:
+        """Return the latest record of a job or None."""
+        return self._records.get((region, indicator, template_hash))
+
+    def is_complete(self, region: str, indicator: str,
+                    template_hash: str) -> bool:
+        """Check if a job has already succeeded (or has no data)."""
+        record = self.get(region, indicator, template_hash)
+        return record is not None and record['status'] != 'failed'
+
+    def record(self, region: str, indicator: str, template_hash: str,
+               code: int, message: str = '', size: int = 0) -> dict:
+        """
+        Append the outcome of a job - a `download()` style exit code and
+        message - to the journal.
+        """
+        with self._lock:
+            previous = self.get(region, indicator, template_hash)
+            record = {
+                'region': region,
+                'indicator': indicator,
+                'template': template_hash,
+                'status': STATUS[code],
+                'attempts': (previous['attempts'] if previous else 0) + 1,
+                'error': message if code == 1 else '',
+                'size': size,
+                'timestamp': datetime.now().isoformat(timespec='seconds')
+            }
+            self._records[self._key(record)] = record
+            with open(self.filename, 'a') as journal:
+                journal.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return record
+
+    def failures(self) -> List[dict]:
+        """Return the latest records of all failed jobs."""
+        return [x for x in self._records.values() if x['status'] == 'failed']
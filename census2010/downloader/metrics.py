@@ -0,0 +1,185 @@
+"""
+Census 2010
+===========
+
+Downloader
+----------
+
+Metrics - structured timing events emitted by the download stages and
+the post-processing functions.
+
+Every event describes one stage run for one region/indicator pair:
+its name, duration, number of bytes produced and outcome. Events are
+passed to all registered sinks - a JSONL file, an in-memory aggregator
+or a Prometheus text file - and nothing is recorded while no sink is
+registered.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+from typing import List
+
+import pandas as pd
+
+
+_sinks = []
+
+
+def add_sink(sink) -> None:
+    """Start passing events to a sink."""
+    _sinks.append(sink)
+
+def remove_sink(sink) -> None:
+    """Stop passing events to a sink."""
+    _sinks.remove(sink)
+
+def emit(stage: str, region: str, indicator: str, duration: float,
+         size: int = 0, outcome: str = 'ok') -> None:
+    """
+    Pass a timing event to every registered sink. `size` is None if the
+    stage failed before its output was known.
+    """
+    if not _sinks:
+        return
+    event = {'stage': stage, 'region': region, 'indicator': indicator,
+             'duration': duration, 'bytes': size, 'outcome': outcome,
+             'timestamp': time.time()}
+    for sink in list(_sinks):
+        sink.write(event)
+
+@contextmanager
+def timed(stage: str, region: str, indicator: str):
+    """
+    Time the body of a `with` block and emit it as an event. The yielded
+    dict can be used to set the `bytes` and `outcome` of the event; an
+    exception leaving the block sets the outcome to its class name (or to
+    that of the original error of a `retry.StageFailed`).
+    """
+    details = {'bytes': 0, 'outcome': 'ok'}
+    start = time.perf_counter()
+    try:
+        yield details
+    except Exception as exc:
+        details['outcome'] = type(getattr(exc, 'error', exc)).__name__
+        raise
+    finally:
+        emit(stage, region, indicator, time.perf_counter() - start,
+             details['bytes'], details['outcome'])
+
+@contextmanager
+def capture():
+    """
+    Collect the events emitted in the body of a `with` block in a
+    yielded `MemorySink` instead of passing them to the registered sinks
+    - e.g. in a worker process, to send them back for `replay()`.
+    """
+    sink = MemorySink()
+    registered = _sinks[:]
+    _sinks[:] = [sink]
+    try:
+        yield sink
+    finally:
+        _sinks[:] = registered
+
+def replay(events: List[dict]) -> None:
+    """Pass events collected by `capture()` to every registered sink."""
+    for event in events:
+        for sink in list(_sinks):
+            sink.write(event)
+
+
+class JsonlSink:
+    """Append every event to a JSONL file."""
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._lock = threading.Lock()
+
+    def write(self, event: dict) -> None:
+        with self._lock:
+            with open(self.filename, 'a') as jsonl:
+                jsonl.write(json.dumps(event) + '\n')
+
+
+class MemorySink:
+    """Keep events in memory for a summary report."""
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def write(self, event: dict) -> None:
+        with self._lock:
+            self.events.append(event)
+
+    def report(self, by: str = 'stage') -> pd.DataFrame:
+        """Return a latency summary of the collected events."""
+        return summary(self.events, by)
+
+
+class PrometheusSink:
+    """
+    Aggregate events into per stage/region duration and byte counters
+    and write them in the Prometheus text format (for the node exporter
+    textfile collector) on `flush()`.
+    """
+    def __init__(self, filename: str, prefix: str = 'census2010'):
+        self.filename = filename
+        self.prefix = prefix
+        self._totals = defaultdict(lambda: [0, 0.0, 0])
+        self._lock = threading.Lock()
+
+    def write(self, event: dict) -> None:
+        key = (event['stage'], event['region'], event['outcome'])
+        with self._lock:
+            totals = self._totals[key]
+            totals[0] += 1
+            totals[1] += event['duration']
+            totals[2] += event['bytes'] or 0
+
+    def flush(self) -> None:
+        """Atomically rewrite the text file with the current totals."""
+        name = f'{self.prefix}_stage'
+        lines = [f'# TYPE {name}_duration_seconds summary',
+                 f'# TYPE {name}_bytes_total counter']
+        with self._lock:
+            items = sorted(self._totals.items())
+        for (stage, region, outcome), (count, seconds, size) in items:
+            labels = (f'{{stage="{stage}",region="{region}",'
+                      f'outcome="{outcome}"}}')
+            lines += [f'{name}_duration_seconds_count{labels} {count}',
+                      f'{name}_duration_seconds_sum{labels} {seconds:.6f}',
+                      f'{name}_bytes_total{labels} {size}']
+        temp = self.filename + '.tmp'
+        with open(temp, 'w') as text_file:
+            text_file.write('\n'.join(lines) + '\n')
+        os.replace(temp, self.filename)
+
+
+def read_events(filename: str) -> List[dict]:
+    """Load events written by a `JsonlSink`."""
+    with open(filename, 'r') as jsonl:
+        return [json.loads(line) for line in jsonl if line.strip()]
+
+def summary(events: List[dict], by: str = 'stage') -> pd.DataFrame:
+    """
+    Summarize event durations (in seconds) grouped by `by` - a column
+    name such as 'stage', 'region' or 'indicator', or a list of them:
+    number of events, errors, p50, p95, total time and bytes.
+    """
+    df = pd.DataFrame(events, columns=['stage', 'region', 'indicator',
+                                       'duration', 'bytes', 'outcome',
+                                       'timestamp'])
+    df['error'] = df.outcome != 'ok'
+    grouped = df.groupby(by)
+    report = pd.DataFrame({
+        'count': grouped.duration.count(),
+        'errors': grouped.error.sum(),
+        'p50': grouped.duration.quantile(0.5),
+        'p95': grouped.duration.quantile(0.95),
+        'total': grouped.duration.sum(),
+        'bytes': grouped.bytes.sum()
+    })
+    return report.sort_values('total', ascending=False)
@@ -0,0 +1,152 @@
+"""
+Census 2010
+===========
+
+Downloader
+----------
+
+Crawl planning - computes the workload of a crawl from the template
+matrix without touching the network.
+
+A plan is a table with one row per (region, indicator) job: the
+endpoint that serves it, its data year, whether it is available, whether a ledger
+lists it as complete, and its estimated duration from recorded metrics
+events. Plans can be summarized by host and year and split into shards
+of similar cost, each saved as a job list another machine can run with
+`download_jobs`.
+"""
+
+import json
+from typing import List
+
+import pandas as pd
+
+from . import metrics
+from . import templates
+from .downloader import STAGE_TIMEOUTS, _region_host
+from .ledger import JobLedger, _template_hash
+
+
+# Estimated duration (in seconds) of a job when no timings are recorded.
+DEFAULT_JOB_SECONDS = 10.0
+
+
+def _job_durations(events: List[dict]) -> pd.DataFrame:
+    """
+    Return the duration of the download stages of every recorded job, by
+    region and indicator: the median over its successful runs, a run
+    being the stages from one `load_region` event to the next.
+    """
+    df = pd.DataFrame(events, columns=['stage', 'region', 'indicator',
+                                       'duration', 'outcome'])
+    df = df[df.stage.isin(STAGE_TIMEOUTS)].copy()
+    pair = [df.region, df.indicator]
+    df['run'] = (df.stage == 'load_region').astype(int).groupby(pair).cumsum()
+    df['failed'] = df.outcome != 'ok'
+    runs = df.groupby(['region', 'indicator', 'run']).agg(
+        duration=('duration', 'sum'), failed=('failed', 'any'))
+    runs = runs[~runs.failed].reset_index()
+    return runs.groupby(['region', 'indicator'],
+                        as_index=False).duration.median()
+
+def _estimates(jobs: pd.DataFrame, events: List[dict]) -> pd.Series:
+    """
+    Estimate the duration of every job: the recorded time of the job
+    itself, else the median of the indicator, else the median of all
+    jobs, else `DEFAULT_JOB_SECONDS`.
+    """
+    durations = _job_durations(events or [])
+    if durations.empty:
+        return pd.Series(DEFAULT_JOB_SECONDS, index=jobs.index)
+    by_job = jobs.merge(durations, how='left', on=['region', 'indicator'])
+    by_indicator = durations.groupby('indicator').duration.median()
+    estimate = by_job.duration.fillna(jobs.indicator.map(by_indicator))
+    return estimate.fillna(durations.duration.median()).set_axis(jobs.index)
+
+def plan(regions: List[str] = None, indicators: List[str] = None,
+         ledger: JobLedger = None, events=None) -> pd.DataFrame:
+    """
+    Enumerate the (region, indicator) jobs of a crawl - all configured
+    regions and indicators unless given - in the order `download_all`
+    runs them.
+
+    Columns: `region`, `indicator`, `host` (the endpoint of the region,
+    e.g. 'rosstat.gov.ru/munst01' - the unit requests are rate limited
+    by), `year` (years of a multi-year table joined with ','),
+    `available`, `done` (the `ledger` lists the job as complete for its
+    current template), `run` (the job needs to be run) and `estimate`
+    (seconds, from the metrics `events` - a list or a `metrics.JsonlSink`
+    filename; 0 for jobs not run).
+    """
+    templates.refresh()
+    regions = templates.regions() if regions is None else regions
+    indicators = templates.indicators() if indicators is None \
+        else indicators
+    rows = []
+    for region in regions:
+        host = _region_host(region)
+        for indicator in indicators:
+            template = templates.lookup(indicator, region)
+            done = ledger is not None and ledger.is_complete(
+                region, indicator, _template_hash(templates._thaw(template)))
+            rows.append({
+                'region': region,
+                'indicator': indicator,
+                'host': host,
+                'year': ','.join(templates._years(template)),
+                'available': templates.is_available(indicator, region),
+                'done': done
+            })
+    jobs = pd.DataFrame(rows, columns=['region', 'indicator', 'host',
+                                       'year', 'available', 'done'])
+    jobs['run'] = jobs.available & ~jobs.done
+    if isinstance(events, str):
+        events = metrics.read_events(events)
+    jobs['estimate'] = _estimates(jobs, events).where(jobs.run, 0.0)
+    return jobs
+
+def summary(jobs: pd.DataFrame, by=('host', 'year')) -> pd.DataFrame:
+    """
+    Summarize a plan grouped by `by` (a column name or a list of them):
+    number of jobs, jobs skipped as unavailable, jobs already done, jobs
+    to run and their estimated duration in seconds.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    grouped = jobs.assign(unavailable=~jobs.available).groupby(by)
+    return pd.DataFrame({
+        'jobs': grouped.region.count(),
+        'unavailable': grouped.unavailable.sum(),
+        'done': grouped.done.sum(),
+        'run': grouped.run.sum(),
+        'estimate': grouped.estimate.sum()
+    })
+
+def shard(jobs: pd.DataFrame, shards: int) -> List[List[tuple]]:
+    """
+    Split the jobs of a plan that need to run into `shards` job lists
+    of similar estimated duration. Jobs of a region stay in one shard,
+    so that every shard fetches a region page only once; regions are
+    assigned to the least loaded shard, most expensive first.
+    """
+    todo = jobs[jobs.run]
+    costs = todo.groupby('region', sort=False).estimate.sum()
+    loads = [0.0] * shards
+    members = [[] for _ in range(shards)]
+    for region in costs.sort_values(ascending=False, kind='stable').index:
+        target = loads.index(min(loads))
+        loads[target] += costs[region]
+        members[target].append(region)
+    return [[(region, indicator)
+             for region, indicator in zip(todo.region, todo.indicator)
+             if region in regions]
+            for regions in map(set, members)]
+
+def save_shard(jobs: List[tuple], filename: str) -> None:
+    """Save a job list as JSON."""
+    with open(filename, 'w') as shard_file:
+        json.dump([list(job) for job in jobs], shard_file)
+
+def load_shard(filename: str) -> List[tuple]:
+    """Load a job list saved by `save_shard`."""
+    with open(filename, 'r') as shard_file:
+        return [tuple(job) for job in json.load(shard_file)]
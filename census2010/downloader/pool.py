@@ -0,0 +1,179 @@
+"""
+Census 2010
+===========
+
+Downloader
+----------
+
+Browser pool - keeps a number of warm Selenium webdriver sessions that
+the downloader functions borrow for every indicator/region pair instead
+of starting a new Chrome instance each time.
+
+Sessions are health-checked before they are handed out, recycled after
+a fixed number of requests and replaced if they crash.
+"""
+
+from contextlib import contextmanager
+import queue
+import threading
+
+import selenium
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+
+MAX_REQUESTS = 50
+
+
+def _launch_browser(headless: bool):
+    """Initialize a Selenium webdriver session and return a handler."""
+    chrome_options = Options()
+    if headless:
+        chrome_options.add_argument('--headless')
+    driver = webdriver.Chrome('./chromedriver', options=chrome_options)
+    return driver
+
+def _quit_browser(driver) -> None:
+    """Close a webdriver session, ignoring errors of a dead browser."""
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+def _is_alive(driver) -> bool:
+    """Check that a webdriver session still responds to commands."""
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+def _reset_browser(driver) -> None:
+    """
+    Bring a used session back to a clean state: dismiss a pending alert,
+    close table windows opened by `_launch_table` and switch back to the
+    first window.
+    """
+    try:
+        driver.switch_to.alert.dismiss()
+    except selenium.common.exceptions.NoAlertPresentException:
+        pass
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+
+
+class BrowserPool:
+    """
+    A thread-safe pool of webdriver sessions.
+
+    At most `size` sessions are alive at any time. A session is quit and
+    replaced by a fresh one after `max_requests` uses, when it fails a
+    health check or when it is released as broken.
+    """
+    def __init__(self, size: int = 1, headless: bool = True,
+                 max_requests: int = MAX_REQUESTS):
+        self.size = size
+        self.headless = headless
+        self.max_requests = max_requests
+        self._idle = queue.LifoQueue()
+        self._uses = {}
+        self._alive = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _launch(self):
+        """Start a new session in a slot that has already been reserved."""
+        try:
+            driver = _launch_browser(self.headless)
+        except Exception:
+            with self._lock:
+                self._alive -= 1
+            raise
+        with self._lock:
+            self._uses[id(driver)] = 0
+        return driver
+
+    def _discard(self, driver) -> None:
+        """Quit a session and free its slot in the pool."""
+        with self._lock:
+            self._uses.pop(id(driver), None)
+            self._alive -= 1
+        _quit_browser(driver)
+
+    def acquire(self):
+        """
+        Borrow a healthy session from the pool, starting a new one if
+        there is a free slot and blocking otherwise.
+        """
+        if self._closed:
+            raise RuntimeError('Browser pool is closed')
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_launch = self._alive < self.size
+                    if can_launch:
+                        # reserve the slot before the (slow) launch
+                        self._alive += 1
+                if can_launch:
+                    return self._launch()
+                # wake up periodically: a discarded session frees a slot
+                # without putting anything into the idle queue
+                try:
+                    driver = self._idle.get(timeout=1)
+                except queue.Empty:
+                    continue
+            if _is_alive(driver):
+                return driver
+            self._discard(driver)
+
+    def release(self, driver, broken: bool = False) -> None:
+        """
+        Return a session to the pool. Broken, exhausted or unresettable
+        sessions are quit so that a fresh one takes their slot.
+        """
+        with self._lock:
+            self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+            exhausted = self._uses[id(driver)] >= self.max_requests
+        if broken or exhausted or self._closed:
+            self._discard(driver)
+            return
+        try:
+            _reset_browser(driver)
+        except Exception:
+            self._discard(driver)
+            return
+        self._idle.put(driver)
+
+    @contextmanager
+    def session(self):
+        """Borrow a session for the duration of a `with` block."""
+        driver = self.acquire()
+        broken = False
+        try:
+            yield driver
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken=broken)
+
+    def close(self) -> None:
+        """Quit every idle session and refuse further requests."""
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
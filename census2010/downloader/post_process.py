@@ -13,30 +13,96 @@ pandas dataframe
 - save the filtered dataset as a pandas-compatible CSV/feather file
 """
 
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                wait)
+import html
+import json
 import os
+import re
+import shutil
+import time
 
-from bs4 import BeautifulSoup
+from lxml import etree
+import numpy as np
 import pandas as pd
-from typing import List
+from typing import Iterator, List, Tuple
 
+from census2010.utils import (ProgressReport, create_folder, map_in_pool,
+                              write_table)
+from . import metrics
+from . import templates
 
-def _format_html(filename: str) -> None:
+
+HTML_HEADER = (
+    r"<html><head><meta charset='UTF-8'></head><style>"
+    r"body {font-family: Arial, sans-serif;background-color: #eeeeee;}"
+    r".bL0 {color: black; font-weight: bold;}"
+    r".bL1 {color: gray; font-weight: normal; font-size: 8pt;}"
+    r".bL2 {color: #006666; font-size: 10pt; padding-left: 20px;}"
+    r"</style><table>"
+)
+HTML_FOOTER = r"</table></html>"
+
+
+def _is_formatted(filename: str) -> bool:
+    """Check if a downloaded HTML file already has the formatting header."""
+    with open(filename, 'r') as html_f:
+        return html_f.read(len(HTML_HEADER)) == HTML_HEADER
+
+def formatted_html(filename: str, chunk_size: int = 1 << 16) -> Iterator[str]:
     """
-    Add formatting headers/footers to downloaded raw HTML.
+    Yield a downloaded HTML file in chunks with the formatting header and
+    footer added (unless it has them already), e.g. to serve it in a
+    viewable state without formatting it on disk.
     """
-    header = (
-        r"<html><head><meta charset='UTF-8'></head><style>"
-        r"body {font-family: Arial, sans-serif;background-color: #eeeeee;}"
-        r".bL0 {color: black; font-weight: bold;}"
-        r".bL1 {color: gray; font-weight: normal; font-size: 8pt;}"
-        r".bL2 {color: #006666; font-size: 10pt; padding-left: 20px;}"
-        r"</style><table>"
-    )
-    footer = r"</table></html>"
-    with open(filename, 'r') as source_html:
-        html_str = source_html.read()
-    with open(filename, 'w') as dest_html:
-        dest_html.write(header + html_str + footer)
+    formatted = _is_formatted(filename)
+    if not formatted:
+        yield HTML_HEADER
+    with open(filename, 'r') as html_f:
+        yield from iter(lambda: html_f.read(chunk_size), '')
+    if not formatted:
+        yield HTML_FOOTER
+
+def _format_html(filename: str) -> bool:
+    """
+    Add formatting headers/footers to downloaded raw HTML. The file is
+    streamed to a temporary file that then replaces it, and a file that
+    is formatted already is left alone. Return whether it was formatted.
+    """
+    if _is_formatted(filename):
+        return False
+    temp = f'{filename}.{os.getpid()}.tmp'
+    with open(filename, 'r') as source_html, open(temp, 'w') as dest_html:
+        dest_html.write(HTML_HEADER)
+        shutil.copyfileobj(source_html, dest_html)
+        dest_html.write(HTML_FOOTER)
+    os.replace(temp, filename)
+    return True
+
+def _format_file(filename: str) -> tuple:
+    """
+    Format a downloaded HTML file, returning a `(code, message,
+    duration, bytes)` tuple instead of raising, so that one bad file
+    doesn't stop a folder.
+    """
+    start = time.perf_counter()
+    try:
+        if _format_html(filename):
+            code, message = 0, 'formatted'
+        else:
+            code, message = 2, 'already formatted'
+        size = os.path.getsize(filename)
+    except Exception as exc:
+        code, message, size = 1, f'{type(exc).__name__}: {exc}', 0
+    return (code, message, time.perf_counter() - start, size)
+
+def _file_pair(filename: str) -> tuple:
+    """
+    Return the (region, indicator) pair a `{ok2}_{indicator}` table
+    file belongs to.
+    """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return (name[:2], name[3:])
 
 def _scan_dir(html_dir: str) -> List[str]:
     """
@@ -47,118 +113,370 @@ def _scan_dir(html_dir: str) -> List[str]:
     filenames = sorted([x for x in f_l if x.endswith('.html')])
     return filenames
 
-def _get_num_of_data_points(html_fn: str) -> str:
+# Row and cell opening/closing tags, any tag, and a digit.
+_ROW_TAG = re.compile(r'<tr\b', re.IGNORECASE)
+_ROW_END = re.compile(r'</tr\b', re.IGNORECASE)
+_CELL_TAG = re.compile(r'<td\b[^>]*>', re.IGNORECASE)
+_CELL_END = re.compile(r'</td\b', re.IGNORECASE)
+_TAG = re.compile(r'<[^>]*>')
+_DIGIT = re.compile(r'\d')
+
+DATA_POINTS_CACHE = '.data_points.json'
+METADATA_REPORT = '.metadata.parquet'
+METADATA_COLUMNS = {
+    "street_network": "str", "nat_ch_perc": "natch1",
+    "nat_ch_total": "natch2",
+    "gender_age_gr": "ag", "migration": "migr", "ethnicity": "ethn",
+    "workers_by_occ": "workers", "wages_by_occ": "wages",
+    "wages_govt": "wgovt", "ungasified": "ungas",
+    "total_housing": "t_h", "deter_housing": "det_h",
+    "subsidies": "subs", "doctors": "doct", "nurses": "nurs",
+    "elderly": "eld", "kindergarten": "kindg", "schools": "schools",
+    "schoolchildren": "sch_ch", "total_new_housing": "t_n_h",
+    "indiv_new_housing": "ind_h", "ndfl": "ndfl", "households":"hh"}
+
+
+def _is_number(cell: str) -> bool:
+    """Check if the html content of a table cell is a number."""
+    if not _DIGIT.search(cell):
+        return False
+    try:
+        float(html.unescape(_TAG.sub('', cell)).replace(',', '.'))
+        return True
+    except ValueError:
+        return False
+
+def _get_num_of_data_points(html_fn: str) -> int:
     """
     Open a downloaded HTML file and determine from it's contents whether
-    the data is on rayon or muni level or error in data.
+    the data is on rayon or muni level or error in data: count the table
+    rows with at least one numeric cell.
+
+    The file is scanned with regular expressions rather than parsed into
+    a tree - every `<tr>` is split into its `<td>` cells and only cells
+    with a digit in them are tried as numbers.
     """
     with open(html_fn, 'r') as html_f:
         html_str = html_f.read()
-    soup = BeautifulSoup(html_str, 'html.parser')
     data_cells = 0
-    rows = soup.find_all('tr')
-    for row in rows:
-        cells = row.find_all('td')
-        for cell in cells:
-            try:
-                float(cell.text.replace(',', '.'))
-                data_cells += 1
-                break
-            except ValueError:
-                pass
+    for row in _ROW_TAG.split(html_str)[1:]:
+        cells = _CELL_TAG.split(_ROW_END.split(row, 1)[0])[1:]
+        if any(_is_number(_CELL_END.split(x, 1)[0]) for x in cells):
+            data_cells += 1
     return data_cells
 
-def extract_metadata(directory: str) -> pd.DataFrame():
-    """Parse filenames for metadata - region code, indicator_code."""
-    directory = directory if directory.endswith('/') else directory + '/'
+def _data_point_counts(directory: str, filenames: List[str],
+                       workers: int = None) -> Tuple[dict, bool]:
+    """
+    Return the number of data points of every file in `filenames` and
+    whether any of them had to be counted again.
+
+    Counts are cached in a `DATA_POINTS_CACHE` file of the directory and
+    only files whose modification time or size changed are scanned, on
+    `workers` processes (see `map_in_pool`).
+    """
+    cache_fn = os.path.join(directory, DATA_POINTS_CACHE)
+    cache = {}
+    if os.path.isfile(cache_fn):
+        with open(cache_fn, 'r') as cache_f:
+            cache = json.load(cache_f)
+    changed = set(cache) != set(filenames)
+    cache = {x: y for x, y in cache.items() if x in filenames}
+    todo = []
+    for filename in filenames:
+        stat = os.stat(os.path.join(directory, filename))
+        key = [stat.st_mtime_ns, stat.st_size]
+        if cache.get(filename, [])[:2] != key:
+            cache[filename] = key
+            todo.append(filename)
+    paths = [os.path.join(directory, x) for x in todo]
+    counts = map_in_pool(_get_num_of_data_points, paths, workers=workers)
+    for filename, count in zip(todo, counts):
+        cache[filename].append(count)
+    if todo or changed:
+        temp = cache_fn + '.tmp'
+        with open(temp, 'w') as cache_f:
+            json.dump(cache, cache_f)
+        os.replace(temp, cache_fn)
+    return ({x: cache[x][2] for x in filenames}, bool(todo) or changed)
+
+def extract_metadata(directory: str, workers: int = None) -> pd.DataFrame:
+    """
+    Parse filenames for metadata - region code, indicator_code - and
+    count the data points of every table: a region x indicator report.
+
+    Only tables changed since the last run are scanned (on `workers`
+    processes, see `_data_point_counts`), and the report itself is cached
+    in a `METADATA_REPORT` parquet file of the directory, which is
+    returned as is while no table has changed. Missing tables are shown
+    as 'n/a' if the config marks the pair as unavailable, else as '-'.
+    """
     file_list = _scan_dir(directory)
-    meta = []
-    ok2 = file_list[0][:2]
-    print(ok2)
-    for x in file_list:
-        meta.append([x[:2], x[3:-5], _get_num_of_data_points(directory + x)])
-        if x[:2] != ok2:
-            ok2 = x[:2]
-            print(ok2)
-    cols = {"street_network": "str", "nat_ch_perc": "natch1",
-            "nat_ch_total": "natch2",
-            "gender_age_gr": "ag", "migration": "migr", "ethnicity": "ethn",
-            "workers_by_occ": "workers", "wages_by_occ": "wages",
-            "wages_govt": "wgovt", "ungasified": "ungas",
-            "total_housing": "t_h", "deter_housing": "det_h",
-            "subsidies": "subs", "doctors": "doct", "nurses": "nurs",
-            "elderly": "eld", "kindergarten": "kindg", "schools": "schools",
-            "schoolchildren": "sch_ch", "total_new_housing": "t_n_h",
-            "indiv_new_housing": "ind_h", "ndfl": "ndfl", "households":"hh"}
-    df = pd.DataFrame(meta, columns=['ok2', 'ind', 'data'])
-    df_p = df.pivot(index='ok2', columns='ind', values='data')
-    df_p.columns = pd.Series(df_p.columns).replace(cols)
-    cols = list(df_p.columns)
-    cols.remove('str')
-    cols.insert(0, 'str')
-    df_n = df_p[cols]
-    df_n = df_n.fillna('-')
-    return df_n
-
-def format_folder(folder:str):
-    """Format a folder of downloaded html tables to a viewable state."""
+    counts, changed = _data_point_counts(directory, file_list, workers)
+    report_fn = os.path.join(directory, METADATA_REPORT)
+    if not changed and os.path.isfile(report_fn):
+        df_p = pd.read_parquet(report_fn)
+    else:
+        meta = [[x[:2], x[3:-5], counts[x]] for x in file_list]
+        df = pd.DataFrame(meta, columns=['ok2', 'ind', 'data'])
+        df_p = df.pivot(index='ok2', columns='ind', values='data')
+        df_p.columns = pd.Series(df_p.columns).replace(METADATA_COLUMNS)
+        cols = list(df_p.columns)
+        cols.remove('str')
+        cols.insert(0, 'str')
+        df_p = df_p[cols].astype('Int64')
+        df_p.to_parquet(report_fn)
+    # tell pairs that are not published from pairs not downloaded
+    available = templates.availability()
+    available = available.rename(columns=METADATA_COLUMNS).reindex(
+        index=df_p.index, columns=df_p.columns, fill_value=True)
+    df_p = df_p.astype(object)
+    return df_p.mask(df_p.isna() & ~available.astype(bool), 'n/a').fillna('-')
+
+def format_folder(folder: str, workers: int = None) -> List[tuple]:
+    """
+    Format a folder of downloaded html tables to a viewable state, on
+    `workers` processes (see `map_in_pool`). Formatting is idempotent - tables that are
+    formatted already are skipped. Return `(html filename, code,
+    message)` tuples in filename order, code being 0 (formatted),
+    1 (error) or 2 (already formatted).
+    """
     htmls = _scan_dir(folder)
-    for html in htmls:
-        _format_html(f'{folder}/{html}'.replace('//','/'))
+    paths = [os.path.join(folder, x) for x in htmls]
+    formatted = map_in_pool(_format_file, paths, workers=workers)
+    results = []
+    for html_fn, (code, message, duration, size) in zip(htmls, formatted):
+        outcome = message.split(':')[0] if code == 1 else 'ok'
+        metrics.emit('format_html', *_file_pair(html_fn), duration, size,
+                     outcome)
+        results.append((html_fn, code, message))
+    return results
+
+def _iter_rows(filename: str) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Stream the rows of a downloaded (& formatted) HTML table as
+    `(class, cells)` tuples, where `class` is the first class of the
+    row's first cell (`TblBok` for data rows) and `cells` are the texts
+    of all its cells. Parsed rows are discarded as soon as they have
+    been yielded, so memory use doesn't grow with the table size.
+    """
+    rows = etree.iterparse(filename, events=('end',), tag='tr', html=True,
+                           encoding='utf-8')
+    for _, row in rows:
+        cells = list(row.iter('td'))
+        if cells:
+            classes = cells[0].get('class', '').split()
+            yield (classes[0] if classes else '',
+                   [''.join(cell.itertext()) for cell in cells])
+        row.clear()
+        while row.getprevious() is not None:
+            del row.getparent()[0]
 
 def _import_html(filename: str) -> pd.DataFrame:
     """Read a downloaded (& formatted) HTML table into a DataFrame."""
-    with open(filename, 'r') as html_file:
-        html_str = html_file.read()
-    soup = BeautifulSoup(html_str, features='lxml')
-    rows = soup.find_all('tr')
-    cells = [[x.text for x in row.find_all('td')] for row in rows]
-    classes = [row.find('td')['class'][0] for row in rows]
-    data = [x[1] for x in zip(classes, cells) if x[0]=='TblBok']
-    cols = [f'd{x}' if x!=0 else 'muni'
-            for x in range(max([len(x) for x in data]))]
-    df = pd.DataFrame(data, columns=cols).fillna('')
+    columns = []
+    n_rows = 0
+    for row_class, cells in _iter_rows(filename):
+        if row_class != 'TblBok':
+            continue
+        for column in columns[len(cells):]:
+            column.append('')
+        for n, cell in enumerate(cells):
+            if n == len(columns):
+                columns.append([''] * n_rows)
+            columns[n].append(cell)
+        n_rows += 1
+    data = {f'd{x}' if x != 0 else 'muni': column
+            for x, column in enumerate(columns)}
+    df = pd.DataFrame(data)
     df.index = df.muni
     df.drop('muni', axis=1, inplace=True)
     return df
 
+# Footer rows rosstat appends below the data: footnotes ("1) ...",
+# "* ..."), notes ("Примечание...") and source references ("Источник...").
+_NOTE_ROW = re.compile(r'^\s*(?:\d+\)|\*|Примечани|Источник)')
+
 def _delete_empty_rows(df: pd.DataFrame) -> pd.DataFrame:
     """Find and delete rows where all data columns are empty in a 
-       DataFrame in an imported format."""
-    cols = list(df.columns)
-    return df.loc[df[cols].sum(axis=1) != '']
+       DataFrame in an imported format, as well as footer/notes rows."""
+    filled = (df != '').to_numpy().any(axis=1)
+    notes = df.index.astype(str).str.contains(_NOTE_ROW)
+    return df.loc[filled & ~notes]
+
+# Cell decorations stripped before numeric conversion: footnote markers
+# at the end of a value ("12,5 1)", "12,5*", "12,5¹") and any whitespace,
+# including the non-breaking space used as a thousands separator. A
+# numeric footnote must be set off by whitespace - in "71)" the digits
+# belong to the value, so such a cell is left unparsed.
+_NOISE = re.compile(r'(?:\s+\d+\)|\s*(?:\*+|[¹²³⁴⁵⁶⁷⁸⁹⁰]+))+\s*$|\s+')
+_DECIMAL_COMMA = str.maketrans(',', '.')
+
+def _column_to_numeric(column: pd.Series) -> tuple:
+    """
+    Convert a column of table cells to floats in one vectorized pass.
+    Blank and '-' cells become 0. Return the converted column and a
+    boolean mask of the cells that couldn't be parsed (left as NaN).
+    """
+    if pd.api.types.is_numeric_dtype(column):
+        return (column.astype(float), pd.Series(False, index=column.index))
+    cleaned = (column.astype(str).str.replace(_NOISE, '', regex=True)
+               .str.translate(_DECIMAL_COMMA))
+    cleaned = cleaned.mask(cleaned.isin(['', '-']), '0')
+    values = pd.to_numeric(cleaned, errors='coerce').astype(float)
+    return (values, values.isna() & (cleaned.str.lower() != 'nan'))
 
 def _df_to_numeric(df: pd.DataFrame) -> pd.DataFrame:
-    """Convert value columns to numeric."""
-    replacements = {'': '0', ' ': '0', '\xa0': '0', '-': '0'}
-    df_num = df.copy().replace(replacements)
-    df_num.replace(',', '.', regex=True, inplace=True)
-    cols = list(df_num.columns)
-    df_num[cols] = df_num[cols].apply(pd.to_numeric)
+    """
+    Convert value columns to numeric.
+
+    Cells that can't be parsed are set to NaN instead of raising; they
+    are listed as `(row, column, cell)` tuples in the `unparsed` entry of
+    the returned frame's `attrs`.
+    """
+    columns = {}
+    unparsed = []
+    for col in df.columns:
+        columns[col], bad = _column_to_numeric(df[col])
+        unparsed += [(df.index[n], col, df[col].iloc[n])
+                     for n in np.flatnonzero(bad.to_numpy())]
+    df_num = pd.DataFrame(columns, index=df.index)
+    df_num.attrs['unparsed'] = unparsed
     return df_num
 
+def _table_metadata(filename: str) -> dict:
+    """
+    Return the region, indicator and data year of a `{ok2}_{indicator}`
+    table file (the year is empty for pairs not in the config).
+    """
+    region, indicator = _file_pair(filename)
+    try:
+        year = templates.get_template(indicator, region)['god']
+    except ValueError:
+        year = ''
+    return {'region': region, 'indicator': indicator, 'year': year}
+
+def _html_to_table(in_filename: str, out_filename: str,
+                   fmt: str = None) -> str:
+    """
+    Convert an html table like `html_to_table` and return a note on the
+    cells that could not be parsed ('' if there are none). `fmt` forces
+    the table format instead of choosing it by extension.
+    """
+    pair = _file_pair(in_filename)
+    with metrics.timed('import_html', *pair) as event:
+        df = _import_html(in_filename)
+        event['bytes'] = os.path.getsize(in_filename)
+    with metrics.timed('delete_empty_rows', *pair):
+        dfr = _delete_empty_rows(df)
+    with metrics.timed('to_numeric', *pair):
+        dfn = _df_to_numeric(dfr)
+    with metrics.timed('write_table', *pair) as event:
+        write_table(dfn.reset_index(), out_filename,
+                    _table_metadata(in_filename), fmt)
+        event['bytes'] = os.path.getsize(out_filename)
+    unparsed = dfn.attrs['unparsed']
+    if not unparsed:
+        return ''
+    return f'{len(unparsed)} cells could not be parsed: {unparsed[:5]}'
+
+def html_to_table(in_filename: str, out_filename: str):
+    """
+    Import an html table, clean it up and save it as a csv, parquet or
+    feather file, depending on the extension of `out_filename`.
+    """
+    note = _html_to_table(in_filename, out_filename)
+    if note:
+        print(f'{in_filename}: {note}')
+
 def html_to_csv(in_filename: str, out_filename: str):
-    """Import an html table, clean it up and save as a csv."""
-    df = _import_html(in_filename)
-    dfr = _delete_empty_rows(df)
-    dfn = _df_to_numeric(dfr)
-    dfn.to_csv(out_filename, sep=';')
+    """
+    Import an html table, clean it up and save as a `;`-separated csv,
+    whatever the extension of `out_filename`.
+    """
+    note = _html_to_table(in_filename, out_filename, 'csv')
+    if note:
+        print(f'{in_filename}: {note}')
 
-def html_folder_to_csv_folder(html_folder: str, csv_folder: str):
-    """Load every html table from a folder, save it as csv to another
-    folder."""
-    l = os.listdir(html_folder)
-    html = sorted([x for x in l if x.endswith('.html')])
-    try:
-        os.makedirs(csv_folder)
-    except FileExistsError:
-        pass
-    for html_fn in html:
-        print(html_fn)
-        csv_fn = csv_folder + '/' + html_fn.split('.')[0] + '.csv'
-        html_to_csv(f'{html_folder}/{html_fn}', csv_fn)
+def _is_up_to_date(source: str, target: str) -> bool:
+    """Check if a target file exists and is newer than its source."""
+    return (os.path.isfile(target) and
+            os.path.getmtime(target) >= os.path.getmtime(source))
 
+def _convert_file(in_filename: str, out_filename: str,
+                  capture: bool = False) -> tuple:
+    """
+    Convert an html table to csv (or another table format), returning a
+    `(code, message, events)` tuple instead of raising, so that one bad
+    table doesn't stop a folder. The message notes unparsed cells. With
+    `capture` (in a worker process) the metrics events of the conversion
+    are returned for the parent to `metrics.replay()` rather than
+    emitted.
+    """
+    if not capture:
+        return _convert(in_filename, out_filename) + ([],)
+    with metrics.capture() as sink:
+        code, message = _convert(in_filename, out_filename)
+    return (code, message, sink.events)
 
+def _convert(in_filename: str, out_filename: str) -> tuple:
+    """Convert an html table and return a `(code, message)` tuple."""
+    try:
+        note = _html_to_table(in_filename, out_filename)
+    except Exception as exc:
+        return (1, f'{type(exc).__name__}: {exc}')
+    return (0, f'converted, {note}' if note else 'converted')
+
+def html_folder_to_csv_folder(html_folder: str, csv_folder: str,
+                              workers: int = None, force: bool = False,
+                              fmt: str = 'csv') -> List[tuple]:
+    """Load every html table from a folder, save it as csv to another
+    folder (or as parquet/feather, with `fmt`).
 
+    Tables are converted on a pool of `workers` processes (all CPUs by
+    default, `workers=1` converts in this process), with at most two
+    tables per worker in flight. Tables whose csv is newer than the html
+    are skipped unless `force` is set. Progress is printed in filename
+    order; a table that fails to convert is reported rather than
+    stopping the folder. Metrics events and notes on unparsed cells of
+    tables converted in worker processes are passed back and emitted or
+    printed here. Return `(html filename, code, message)` tuples in
+    filename order, code being 0 (converted), 1 (error) or 2 (up to
+    date)."""
+    html = _scan_dir(html_folder)
+    create_folder(csv_folder)
+    jobs = [(html_fn,) for html_fn in html]
+    progress = ProgressReport(jobs, status={2: 'up to date'})
+    results = [None] * len(html)
+    todo = []
+    for index, html_fn in enumerate(html):
+        in_fn = f'{html_folder}/{html_fn}'
+        csv_fn = csv_folder + '/' + html_fn.split('.')[0] + '.' + fmt
+        if not force and _is_up_to_date(in_fn, csv_fn):
+            results[index] = (html_fn, 2, 'up to date')
+            progress.done(index, 2, 'up to date')
+        else:
+            todo.append((index, in_fn, csv_fn))
 
+    def finish(index, code, message, events):
+        metrics.replay(events)
+        results[index] = (html[index], code, message)
+        progress.done(index, code, message)
 
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for index, in_fn, csv_fn in todo:
+            finish(index, *_convert_file(in_fn, csv_fn))
+        return results
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+        for index, in_fn, csv_fn in todo:
+            if len(in_flight) >= 2 * workers:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(in_flight.pop(future), *future.result())
+            in_flight[executor.submit(_convert_file, in_fn, csv_fn,
+                                      True)] = index
+        for future in wait(in_flight).done:
+            finish(in_flight[future], *future.result())
+    return results
@@ -0,0 +1,140 @@
+"""
+Census 2010
+===========
+
+Downloader
+----------
+
+Retry policy - re-runs a failed download stage with exponential backoff
+and jitter, as long as the failure looks transient.
+
+Timeouts, stale elements, browser hiccups and network or 5xx errors are
+transient: the same stage is likely to succeed a moment later. Alerts,
+missing elements (e.g. an indicator that a region doesn't publish) and
+anything unexpected are permanent and fail the stage at once.
+"""
+
+import asyncio
+from collections import OrderedDict
+import random
+import time
+from typing import Callable, List
+
+import aiohttp
+import requests
+from selenium.common import exceptions as wd_exceptions
+
+
+PERMANENT = (wd_exceptions.UnexpectedAlertPresentException,
+             wd_exceptions.NoSuchElementException,
+             wd_exceptions.InvalidSelectorException)
+TRANSIENT = (wd_exceptions.TimeoutException,
+             wd_exceptions.StaleElementReferenceException,
+             wd_exceptions.WebDriverException,
+             requests.exceptions.Timeout,
+             requests.exceptions.ConnectionError,
+             aiohttp.ClientConnectionError,
+             asyncio.TimeoutError,
+             ConnectionError)
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Classify an exception raised by a download stage."""
+    if isinstance(exc, PERMANENT):
+        return False
+    if isinstance(exc, requests.exceptions.HTTPError):
+        status = exc.response.status_code if exc.response is not None else 0
+        return status == 429 or status >= 500
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status == 429 or exc.status >= 500
+    return isinstance(exc, TRANSIENT)
+
+
+class StageFailed(Exception):
+    """
+    A download stage has failed for good. `error` is the original
+    exception, `attempts` the number of times the stage was run.
+    """
+    def __init__(self, error: BaseException, attempts: int):
+        super().__init__(str(error))
+        self.error = error
+        self.attempts = attempts
+        self.transient = is_transient(error)
+
+    def describe(self, message: str) -> str:
+        """Append the failure details to a stage error message."""
+        kind = 'transient' if self.transient else 'permanent'
+        detail = f'{kind}: {type(self.error).__name__}'
+        if self.attempts > 1:
+            detail += f', {self.attempts} attempts'
+        return f'{message} ({detail})'
+
+
+class RetryPolicy:
+    """
+    Run a stage up to `attempts` times. The n-th retry waits
+    `base_delay * 2**(n-1)` seconds (at most `max_delay`), scaled by a
+    random factor in `1 +- jitter`.
+    """
+    def __init__(self, attempts: int = 3, base_delay: float = 1.0,
+                 max_delay: float = 30.0, jitter: float = 0.5):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, retry: int) -> float:
+        """Return the backoff delay before the n-th retry (n >= 1)."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def call(self, stage: Callable, *args):
+        """
+        Run `stage(*args)` and return its result, retrying transient
+        failures. Raise `StageFailed` once the stage can't succeed.
+        """
+        attempt = 1
+        while True:
+            try:
+                return stage(*args)
+            except Exception as exc:
+                if attempt >= self.attempts or not is_transient(exc):
+                    raise StageFailed(exc, attempt) from exc
+            time.sleep(self.delay(attempt))
+            attempt += 1
+
+    async def call_async(self, stage: Callable, *args):
+        """Await `stage(*args)` with the same retry rules as `call`."""
+        attempt = 1
+        while True:
+            try:
+                return await stage(*args)
+            except Exception as exc:
+                if attempt >= self.attempts or not is_transient(exc):
+                    raise StageFailed(exc, attempt) from exc
+            await asyncio.sleep(self.delay(attempt))
+            attempt += 1
+
+
+DEFAULT_POLICY = RetryPolicy()
+NO_RETRY = RetryPolicy(attempts=1)
+
+
+def failure_summary(results: List[tuple]) -> str:
+    """
+    Summarize the failed jobs of a `run_jobs` result list, grouped by
+    stage error, so it is clear which region/indicator pairs need
+    attention. Return an empty string if nothing failed.
+    """
+    groups = OrderedDict()
+    for job, code, message in results:
+        if code == 1:
+            groups.setdefault(message.split(' (')[0], []).append(job)
+    if not groups:
+        return ''
+    total = sum(len(x) for x in groups.values())
+    lines = [f'{total} jobs need attention:']
+    for error, jobs in groups.items():
+        pairs = ', '.join('_'.join(job) for job in jobs)
+        lines.append(f'  {error} ({len(jobs)}): {pairs}')
+    return '\n'.join(lines)
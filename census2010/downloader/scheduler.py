@@ -0,0 +1,101 @@
+"""
+Census 2010
+===========
+
+Downloader
+----------
+
+Scheduler - spreads a list of download jobs (region/indicator pairs)
+over a number of concurrent workers.
+
+Jobs are fed to the workers through a bounded queue, request starts are
+rate limited per host and the progress is reported in job order no
+matter in which order the workers finish.
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Hashable, List, Tuple
+
+from census2010.utils import ProgressReport
+
+
+STATUS = {0: 'Success!', 2: 'no data'}
+
+
+class RateLimiter:
+    """
+    Limit the number of request starts per second for every host
+    independently. `rate=None` disables the limit.
+    """
+    def __init__(self, rate: float = None):
+        self.interval = 1 / rate if rate else 0
+        self._next_start = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, host: Hashable) -> float:
+        """
+        Book the next start slot for a request to `host` and return the
+        number of seconds to wait for it.
+        """
+        if not self.interval:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.interval
+        return start - now
+
+    def wait(self, host: Hashable) -> None:
+        """Block until a new request to `host` is allowed to start."""
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def run_jobs(jobs: List[tuple], worker: Callable, workers: int = 1,
+             rate: float = None, host: Callable = None,
+             queue_size: int = None,
+             report: Callable = print) -> List[Tuple[tuple, int, str]]:
+    """
+    Run `worker(job)` for every job on `workers` concurrent threads and
+    return `(job, code, message)` tuples in the order of `jobs`.
+
+    `worker` returns a `(code, message)` tuple as `download()` does; an
+    exception raised by the worker is reported as an error (code 1).
+    `host(job)` names the host a job talks to - request starts are
+    limited to `rate` per second per host. At most `queue_size` jobs
+    (twice the number of workers by default) wait in the queue.
+    """
+    host = host or (lambda job: None)
+    limiter = RateLimiter(rate)
+    progress = ProgressReport(jobs, report, STATUS)
+    job_queue = queue.Queue(maxsize=queue_size or 2 * workers)
+    results = [None] * len(jobs)
+
+    def consume():
+        while True:
+            item = job_queue.get()
+            if item is None:
+                return
+            index, job = item
+            limiter.wait(host(job))
+            try:
+                code, message = worker(job)
+            except Exception as exc:
+                code, message = 1, f'{type(exc).__name__}: {exc}'
+            results[index] = (job, code, message)
+            progress.done(index, code, message)
+
+    threads = [threading.Thread(target=consume, daemon=True)
+               for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for item in enumerate(jobs):
+        job_queue.put(item)
+    for _ in threads:
+        job_queue.put(None)
+    for thread in threads:
+        thread.join()
+    return results
@@ -0,0 +1,201 @@
+"""
+Census 2010
+===========
+
+Downloader
+----------
+
+Template registry - resolves the templates of all indicator/region
+pairs from `config.py` once and serves them from memory.
+
+The registry is compiled on first use into an immutable region x
+indicator matrix of resolved templates, together with a bitmap of the
+available pairs and an index of the pairs by data year. `refresh()`
+recompiles it only if the config file has changed on disk (checked by
+mtime/size first and by content hash second), so calling it at the start
+of every run is cheap and keeps hot reloading of the config possible.
+"""
+
+import hashlib
+from importlib import reload
+import os
+import threading
+from types import MappingProxyType
+from typing import List, Mapping
+
+import numpy as np
+import pandas as pd
+
+from . import config
+
+
+_lock = threading.RLock()
+_registry = {'stat': None, 'digest': None, 'matrix': None}
+
+
+def _config_stat() -> tuple:
+    """Return the (mtime, size) signature of the config file."""
+    stat = os.stat(config.__file__)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _config_digest() -> str:
+    """Return the content hash of the config file."""
+    with open(config.__file__, 'rb') as config_file:
+        return hashlib.sha1(config_file.read()).hexdigest()
+
+def _freeze(value):
+    """
+    Return a read-only copy of a template value: dicts become mapping
+    proxies and lists become tuples, recursively.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({x: _freeze(y) for x, y in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(x) for x in value)
+    return value
+
+def _thaw(value):
+    """Return a mutable copy of a value frozen by `_freeze`."""
+    if isinstance(value, Mapping):
+        return {x: _thaw(y) for x, y in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(x) for x in value]
+    return value
+
+def _years(template: Mapping) -> list:
+    """Return the data years of a template (`god` is a year or a list)."""
+    years = template.get('god', [])
+    return list(years) if isinstance(years, (list, tuple)) else [years]
+
+def _compile() -> Mapping:
+    """
+    Resolve the template of every indicator/region pair into read-only
+    mappings, with a bitmap of the available pairs (regions x indicators)
+    and the available (region, indicator) pairs of every data year.
+    """
+    indicators = tuple(config.templates)
+    regions = tuple(config.region_codes)
+    resolved = {}
+    available = np.zeros((len(regions), len(indicators)), dtype=bool)
+    by_year = {}
+    for i, region in enumerate(regions):
+        for j, indicator in enumerate(indicators):
+            template = config._calc_template(indicator, region)
+            resolved[(indicator, region)] = _freeze(template)
+            if template.get('available') == 'yes':
+                available[i, j] = True
+                for year in _years(template):
+                    by_year.setdefault(year, []).append((region, indicator))
+    available.setflags(write=False)
+    return MappingProxyType({
+        'templates': MappingProxyType(resolved),
+        'indicators': indicators,
+        'regions': regions,
+        'indicator_index': MappingProxyType(
+            {x: n for n, x in enumerate(indicators)}),
+        'region_index': MappingProxyType(
+            {x: n for n, x in enumerate(regions)}),
+        'available': available,
+        'by_year': MappingProxyType({x: tuple(y)
+                                     for x, y in by_year.items()})
+    })
+
+def refresh(force: bool = False) -> bool:
+    """
+    Reload `config.py` and recompile the registry if the config file has
+    changed since the last compilation (or if `force` is set). Return
+    True if the registry was recompiled.
+    """
+    with _lock:
+        stat = _config_stat()
+        if not force and _registry['matrix'] is not None:
+            if stat == _registry['stat']:
+                return False
+            if _config_digest() == _registry['digest']:
+                _registry['stat'] = stat
+                return False
+        if _registry['matrix'] is not None or force:
+            reload(config)
+        _registry['stat'] = stat
+        _registry['digest'] = _config_digest()
+        _registry['matrix'] = _compile()
+        return True
+
+def matrix() -> Mapping:
+    """
+    Return the compiled (read-only) template matrix, compiling it on
+    first use: `templates` by (indicator, region), `indicators`,
+    `regions`, their positions (`indicator_index`, `region_index`), the
+    `available` bitmap and the available pairs `by_year`.
+    """
+    if _registry['matrix'] is None:
+        refresh()
+    return _registry['matrix']
+
+def _templates() -> Mapping:
+    """Return the resolved templates by (indicator, region)."""
+    return matrix()['templates']
+
+def _unknown(indicator_name: str, region_code: str) -> ValueError:
+    """Return the error for a pair that is not in the matrix."""
+    if indicator_name not in matrix()['indicator_index']:
+        return ValueError('Unknown indicator')
+    return ValueError('Unknown region code')
+
+def lookup(indicator_name: str, region_code: str) -> Mapping:
+    """
+    Return the resolved template of an indicator/region pair as a
+    read-only mapping, its lists frozen into tuples (use `get_template`
+    for a copy to modify).
+    """
+    try:
+        return _templates()[(indicator_name, region_code)]
+    except KeyError:
+        raise _unknown(indicator_name, region_code)
+
+def get_template(indicator_name: str, region_code: str) -> dict:
+    """
+    Return (a copy of) the resolved template of an indicator/region pair.
+    """
+    return _thaw(lookup(indicator_name, region_code))
+
+def is_available(indicator_name: str, region_code: str) -> bool:
+    """Check if a region publishes an indicator."""
+    compiled = matrix()
+    try:
+        return bool(compiled['available'][
+            compiled['region_index'][region_code],
+            compiled['indicator_index'][indicator_name]])
+    except KeyError:
+        raise _unknown(indicator_name, region_code)
+
+def availability() -> pd.DataFrame:
+    """Return the availability bitmap as a regions x indicators table."""
+    compiled = matrix()
+    return pd.DataFrame(compiled['available'], index=compiled['regions'],
+                        columns=compiled['indicators'])
+
+def pairs(year: str = None) -> List[tuple]:
+    """
+    Return the available (region, indicator) pairs - all of them, or
+    those with data for a given `year`.
+    """
+    compiled = matrix()
+    if year is not None:
+        return list(compiled['by_year'].get(str(year), ()))
+    rows, cols = np.nonzero(compiled['available'])
+    return [(compiled['regions'][i], compiled['indicators'][j])
+            for i, j in zip(rows, cols)]
+
+def indicator_code(indicator_name: str) -> str:
+    """Return the form checkbox name (id) of an indicator."""
+    matrix()
+    return config.templates[indicator_name]['id']
+
+def indicators() -> List[str]:
+    """Return the names of all configured indicators."""
+    return list(matrix()['indicators'])
+
+def regions() -> List[str]:
+    """Return the OK2 codes of all configured regions."""
+    return list(matrix()['regions'])
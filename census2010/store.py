@@ -0,0 +1,156 @@
+"""
+Census 2010
+===========
+
+Dataset store
+-------------
+
+Dataset store keeps all parsed region/indicator tables in a single
+SQLite file, in long format - one row per municipality and data series:
+`region`, `indicator`, `year`, `row`, `muni`, `oktmo`, `series`, `value`.
+
+Tables are indexed by (region, indicator), so a slice can be queried
+without reading any other table, and a single table can be rebuilt in
+the wide `muni`, `d1`, `d2`... shape the per-file tables have.
+"""
+
+import json
+import os
+import re
+import sqlite3
+from typing import List
+
+import pandas as pd
+
+from census2010.downloader import templates
+from census2010.utils import TABLE_FORMATS, read_table, read_table_metadata
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS data (
+    region TEXT NOT NULL,
+    indicator TEXT NOT NULL,
+    year TEXT,
+    row INTEGER NOT NULL,
+    muni TEXT,
+    oktmo TEXT,
+    series TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS data_pair ON data (region, indicator);
+'''
+
+# An OKTMO code (8 or 11 digits) mentioned in a municipality label.
+_OKTMO = re.compile(r'(?<!\d)(\d{11}|\d{8})(?!\d)')
+
+
+def _oktmo(muni: str) -> str:
+    """Return the OKTMO code mentioned in a municipality label, if any."""
+    found = _OKTMO.search(str(muni))
+    return found.group(1) if found else None
+
+
+class DatasetStore:
+    """A single-file store of all parsed region/indicator tables."""
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        """Close the database file."""
+        self.connection.close()
+
+    def add_table(self, df: pd.DataFrame, region: str, indicator: str,
+                  year=None) -> None:
+        """
+        Store a wide indicator table (a `muni` column and `d{x}` value
+        columns), replacing what was stored for the pair before.
+        """
+        if isinstance(year, list):
+            year = json.dumps(year)
+        series = [x for x in df.columns if x != 'muni']
+        long = df.reset_index(drop=True).rename_axis('row').reset_index()
+        long = long.melt(id_vars=['row', 'muni'], value_vars=series,
+                         var_name='series', value_name='value')
+        long['oktmo'] = long.muni.map(_oktmo)
+        long['value'] = long.value.astype(float).astype(object).where(
+            long.value.notna(), None)
+        rows = zip(long.row.tolist(), long.muni.tolist(),
+                   long.oktmo.tolist(), long.series.tolist(),
+                   long.value.tolist())
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM data WHERE region = ? AND indicator = ?',
+                (region, indicator))
+            self.connection.executemany(
+                'INSERT INTO data VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(region, indicator, year, *row) for row in rows])
+
+    def add_file(self, filename: str) -> None:
+        """
+        Store a parsed `{ok2}_{indicator}` table file (csv, parquet or
+        feather). Region, indicator and year are taken from the embedded
+        metadata if there is any, else from the filename and the config.
+        """
+        name = os.path.splitext(os.path.basename(filename))[0]
+        meta = read_table_metadata(filename)
+        if not meta:
+            meta = {'region': name[:2], 'indicator': name[3:]}
+            try:
+                meta['year'] = templates.get_template(name[3:],
+                                                      name[:2])['god']
+            except ValueError:
+                meta['year'] = None
+        self.add_table(read_table(filename), meta['region'],
+                       meta['indicator'], meta['year'] or None)
+
+    def add_folder(self, folder: str) -> int:
+        """Store every parsed table file of a folder; return their number."""
+        filenames = sorted(x for x in os.listdir(folder)
+                           if os.path.splitext(x)[1] in TABLE_FORMATS)
+        for filename in filenames:
+            self.add_file(os.path.join(folder, filename))
+        return len(filenames)
+
+    def pairs(self) -> List[tuple]:
+        """List the stored (region, indicator) pairs."""
+        return self.connection.execute(
+            'SELECT DISTINCT region, indicator FROM data '
+            'ORDER BY region, indicator').fetchall()
+
+    def query(self, region: str = None, indicator: str = None,
+              series: str = None) -> pd.DataFrame:
+        """
+        Return the long-format rows of a slice of the store; any of
+        `region`, `indicator` and `series` left out matches everything.
+        """
+        filters = {'region': region, 'indicator': indicator,
+                   'series': series}
+        where = [f'{key} = ?' for key, value in filters.items()
+                 if value is not None]
+        params = [value for value in filters.values() if value is not None]
+        sql = ('SELECT region, indicator, year, row, muni, oktmo, series, '
+               'value FROM data')
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY region, indicator, row, series'
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def table(self, region: str, indicator: str) -> pd.DataFrame:
+        """Rebuild a stored table in its wide `muni`, `d{x}` shape."""
+        long = self.query(region, indicator)
+        if long.empty:
+            raise KeyError(f'{region}_{indicator}')
+        wide = long.pivot(index=['row', 'muni'], columns='series',
+                          values='value')
+        wide = wide[sorted(wide.columns, key=lambda x: int(x[1:]))]
+        wide = wide.reset_index().drop('row', axis=1)
+        wide.columns.name = None
+        return wide
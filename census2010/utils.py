@@ -8,9 +8,22 @@ Utilities
 Utilities sub-package provides tools to:
 - validate folder names
 - create folder if it doesn't exist
+- read and write parsed indicator tables as `;`-separated CSV, Parquet
+  or Feather files (chosen by file extension)
+- report the progress of a list of jobs in order
+- map a function over a list of jobs on a process pool
 """
 
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import json
 import os
+import threading
+from typing import Callable, Iterator, List
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather, parquet
 
 
 def _validate_folder(folder: str) -> str:
@@ -21,3 +34,108 @@ def create_folder(folder: str):
     """Create a directory if it doesn't exist."""
     if not os.path.isdir(_validate_folder(folder)):
         os.makedirs(folder)
+
+
+TABLE_FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.feather': 'feather'}
+METADATA_KEY = b'census2010'
+
+
+def _table_format(filename: str) -> str:
+    """Return the table format of a file by its extension."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in TABLE_FORMATS:
+        raise ValueError(f'Unknown table format: {ext}')
+    return TABLE_FORMATS[ext]
+
+def write_table(df: pd.DataFrame, filename: str, metadata: dict = None,
+                fmt: str = None):
+    """
+    Save an indicator table in format `fmt` ('csv', 'parquet' or
+    'feather'; by the extension of `filename` if not given). Parquet and
+    Feather files keep the column types and embed `metadata` (e.g.
+    region, indicator, year) in the file; CSV files are `;`-separated and
+    carry no metadata.
+    """
+    fmt = fmt or _table_format(filename)
+    if fmt not in TABLE_FORMATS.values():
+        raise ValueError(f'Unknown table format: {fmt}')
+    if fmt == 'csv':
+        df.to_csv(filename, sep=';', index=False)
+        return
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    schema_meta = {**(table.schema.metadata or {}),
+                   METADATA_KEY: json.dumps(metadata or {}).encode('utf-8')}
+    table = table.replace_schema_metadata(schema_meta)
+    if fmt == 'parquet':
+        parquet.write_table(table, filename)
+    else:
+        feather.write_feather(table, filename)
+
+def read_table(filename: str) -> pd.DataFrame:
+    """Load an indicator table saved by `write_table`."""
+    fmt = _table_format(filename)
+    if fmt == 'csv':
+        return pd.read_csv(filename, sep=';')
+    if fmt == 'parquet':
+        return pd.read_parquet(filename)
+    return pd.read_feather(filename)
+
+def read_table_metadata(filename: str) -> dict:
+    """Return the metadata embedded in a Parquet or Feather table."""
+    fmt = _table_format(filename)
+    if fmt == 'csv':
+        return {}
+    if fmt == 'parquet':
+        schema = parquet.read_schema(filename)
+    else:
+        schema = feather.read_table(filename, memory_map=True).schema
+    return json.loads((schema.metadata or {}).get(METADATA_KEY, b'{}'))
+
+def map_in_pool(func: Callable, *iterables, workers: int = None,
+                chunksize: int = 8) -> Iterator:
+    """
+    Map `func` over `iterables` (sequences, as with `map`) on a pool of
+    `workers` processes - all CPUs by default, `workers=1` runs in this
+    process - and yield the results in order as they become available.
+    `func` and its arguments must be picklable to run on the pool.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(iterables[0]))
+    if workers <= 1:
+        yield from map(func, *iterables)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(func, *iterables, chunksize=chunksize)
+
+
+class ProgressReport:
+    """
+    Print one line per finished job, in the order the jobs were
+    submitted. A job that finishes early is held back until every job
+    before it has been reported. `status` maps exit codes other than 1
+    (error) to the status text shown; the job message is shown for codes
+    it doesn't map.
+    """
+    def __init__(self, jobs: List[tuple], stream: Callable = print,
+                 status: dict = None):
+        self.jobs = jobs
+        self.stream = stream
+        self.status = status or {}
+        self._results = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def done(self, index: int, code: int, message: str) -> None:
+        """Register a job result and print everything that is due."""
+        with self._lock:
+            self._results[index] = (code, message)
+            while self._next in self._results:
+                self.stream(self._format(self._next))
+                self._next += 1
+
+    def _format(self, index: int) -> str:
+        """Format a progress line for a finished job."""
+        code, message = self._results[index]
+        status = self.status.get(code, message) if code != 1 else message
+        timestamp = datetime.now().strftime("%T")
+        job = ' - '.join(self.jobs[index])
+        return f'{timestamp} - [{index+1}/{len(self.jobs)}] - {job} - {status}'
@@ -0,0 +1,97 @@
+"""
+Unit tests suite for Augmentation sub-package.
+"""
+
+import pandas as pd
+
+from census2010.augmentation import augment
+
+
+HELPER = pd.DataFrame({
+    'muni': ['Всего', 'Район 1 муниципальный район', 'Поселение 1',
+             'Поселение 2', 'Городские округа', 'Город 1'],
+    'd1': [100.0, 60.0, 20.0, 40.0, 40.0, 40.0]})
+
+
+def test_add_rayons():
+    """Test that every record gets the rayon above it."""
+    ind = augment._add_rayons(HELPER)
+    assert ind.rayon.tolist() == [
+        '', 'Район 1 муниципальный район', 'Район 1 муниципальный район',
+        'Район 1 муниципальный район', 'Городские округа', 'Город 1']
+    assert ind.rayon_v.tolist() == [0, 60.0, 60.0, 60.0, 40.0, 40.0]
+
+def test_augment_folder(tmp_path):
+    """Test that config pairs are resolved across regions and augmented."""
+    src = pd.DataFrame({'muni': ['Район 1 муниципальный район', 'Город 1'],
+                        'd1': [30.0, 10.0]})
+    for folder in ['src', 'hlp']:
+        (tmp_path / folder).mkdir()
+    for region in ['01', '14']:
+        src.to_csv(tmp_path / 'src' / f'{region}_wages_govt.csv', sep=';',
+                   index=False)
+    HELPER.to_csv(tmp_path / 'hlp' / '01_augm_wages_muni.csv', sep=';',
+                  index=False)
+    augmentations = [{'source_indicator': 'wages_govt',
+                      'helper_indicator': 'augm_wages_muni'}, {}]
+    results = augment.augment_folder(str(tmp_path / 'src'),
+                                     str(tmp_path / 'hlp'),
+                                     str(tmp_path / 'out'), augmentations,
+                                     workers=1)
+    assert [x[1:] for x in results] == [(0, 'augmented'),
+                                        (2, 'No table 14_augm_wages_muni')]
+    out = pd.read_csv(tmp_path / 'out' / '01_wages_govt.csv', sep=';')
+    assert out.d1.tolist()[1:4] == [30.0, 10.0, 20.0]
+
+def test_update_indicator():
+    """Test augmentation on a DataFrame and on a prebuilt RayonIndex."""
+    src = pd.DataFrame({'muni': ['Район 1 муниципальный район', 'Город 1'],
+                        'd1': [30.0, 10.0]})
+    index = augment.RayonIndex(HELPER)
+    for helper in [HELPER, index]:
+        aug = augment.update_indicator(src, helper)
+        assert aug.columns.tolist() == ['muni', 'd1']
+        pd.testing.assert_series_equal(
+            aug.d1, pd.Series([None, 30.0, 10.0, 20.0, None, 10.0],
+                              dtype=float, name='d1'))
+    assert index.totals['Район 1 муниципальный район'] == 60.0
+    sums = index.sums()
+    assert sums['Район 1 муниципальный район'] == 60.0
+    assert sums['Город 1'] == 40.0
+
+def test_update_indicator_series():
+    """Test that every value column is augmented by the helper ratios."""
+    src = pd.DataFrame({'muni': ['Район 1 муниципальный район', 'Город 1'],
+                        'd1': [30.0, 10.0], 'd2': [60.0, 5.0]})
+    aug = augment.update_indicator(src, HELPER)
+    assert aug.columns.tolist() == ['muni', 'd1', 'd2']
+    assert aug.d1.tolist()[1:4] == [30.0, 10.0, 20.0]
+    assert aug.d2.tolist()[1:4] == [60.0, 20.0, 40.0]
+    assert aug.d2.tolist()[5] == 5.0
+
+def test_update_indicator_duplicates():
+    """Test that a rayon repeated in the source uses its first record."""
+    src = pd.DataFrame({'muni': ['Район 1 муниципальный район', 'Город 1',
+                                 'Город 1'],
+                        'd1': [30.0, 10.0, 11.0]})
+    aug = augment.update_indicator(src, HELPER)
+    assert aug.d1.tolist()[1:4] == [30.0, 10.0, 20.0]
+    assert aug.d1.tolist()[5] == 10.0
+
+def test_rayon_index_cache(tmp_path, monkeypatch):
+    """Test that rayon indexes are cached per file, bounded and clearable."""
+    monkeypatch.setattr(augment, 'RAYON_INDEX_CACHE_SIZE', 2)
+    augment.clear_rayon_indexes()
+    filenames = []
+    for region in ['01', '03', '04']:
+        filename = str(tmp_path / f'{region}_augm_wages_muni.csv')
+        HELPER.to_csv(filename, sep=';', index=False)
+        filenames.append(filename)
+    index = augment.rayon_index(filenames[0])
+    assert augment.rayon_index(filenames[0]) is index
+    augment.rayon_index(filenames[1])
+    augment.rayon_index(filenames[2])
+    assert len(augment._rayon_indexes) == 2
+    assert augment.rayon_index(filenames[0]) is not index
+    augment.clear_rayon_indexes()
+    assert not augment._rayon_indexes
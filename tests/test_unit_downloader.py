@@ -2,6 +2,13 @@
 Unit tests suite for Downloader sub-package.
 """
 
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+import time
+from urllib.parse import parse_qsl
+
 import pytest
 
 import census2010.downloader as cd
@@ -17,23 +24,384 @@ def test_get_template_default_template():
     Test how template is calculated when there are no customizations.
     """
     templ = cd.templates.get_template('street_network', '01')
-    assert templ == {'munr': '*', 'tippos': '*', 'oktmo': '*', 'god': '2010',
-                     'period': 'значение показателя за год'}
+    assert templ == {'available': 'yes', 'munr': '*', 'tippos': '*',
+                     'oktmo': '*', 'god': '2010',
+                     'period': ['значение показателя за год',
+                                'значение за год',
+                                'Значение показателя за год']}
 
 def test_get_template_customized_indicator():
     """
     Test how template is calculated when indicator customizations
     override default template.
     """
-    templ = cd.templates.get_template('natural_change', '01')
-    assert templ == {'munr': '*', 'tippos': '*', 'oktmo': '*', 'god': '2012',
-                     'period': 'значение показателя за год'}
+    templ = cd.templates.get_template('nat_ch_perc', '04')
+    assert templ['god'] == '2016'
+    assert templ['available'] == 'yes'
 
 def test_get_template_custom_region_template():
     """
     Test how template is calculated when there are customizations on
     region level.
     """
-    templ = cd.templates.get_template('natural_change', '99')
-    assert templ == {'munr': '*', 'tippos': '*', 'oktmo': '*', 'god': '2012',
-                     'period': 'январь-март'}
+    assert cd.templates.get_template('nat_ch_perc', '01')['god'] == '2014'
+    templ = cd.templates.get_template('nat_ch_perc', '44')
+    assert templ['available'] == 'no'
+    assert templ['god'] == '2016'
+
+class _FakeDriver:
+    """A stand-in for a webdriver session."""
+    def __init__(self):
+        self.alive = True
+        self.quits = 0
+        self.window_handles = ['main']
+        self.switch_to = self
+
+    @property
+    def current_url(self):
+        if not self.alive:
+            raise RuntimeError('browser crashed')
+        return 'about:blank'
+
+    @property
+    def alert(self):
+        raise cd.pool.selenium.common.exceptions.NoAlertPresentException
+
+    def window(self, handle):
+        pass
+
+    def quit(self):
+        self.quits += 1
+
+def test_browser_pool_reuses_and_recycles(monkeypatch):
+    """Test that sessions are reused and recycled after `max_requests`."""
+    monkeypatch.setattr(cd.pool, '_launch_browser', lambda h: _FakeDriver())
+    with cd.BrowserPool(size=1, max_requests=2) as pool:
+        with pool.session() as first:
+            pass
+        with pool.session() as second:
+            pass
+        assert first is second
+        assert first.quits == 1
+        with pool.session() as third:
+            pass
+        assert third is not first
+
+def test_browser_pool_replaces_crashed_session(monkeypatch):
+    """Test that a session failing the health check is replaced."""
+    monkeypatch.setattr(cd.pool, '_launch_browser', lambda h: _FakeDriver())
+    with cd.BrowserPool(size=1) as pool:
+        with pool.session() as first:
+            pass
+        first.alive = False
+        with pool.session() as second:
+            pass
+        assert second is not first
+        assert first.quits == 1
+
+def test_run_jobs_reports_in_order():
+    """Test that concurrent jobs are reported in submission order."""
+    jobs = [('01', 'a'), ('03', 'b'), ('04', 'c'), ('05', 'd')]
+    delays = {'a': 0.03, 'b': 0.0, 'c': 0.02, 'd': 0.0}
+    lines = []
+
+    def worker(job):
+        time.sleep(delays[job[1]])
+        if job[1] == 'c':
+            raise RuntimeError('boom')
+        return (0, 'Success!')
+
+    results = cd.scheduler.run_jobs(jobs, worker, workers=3,
+                                    report=lines.append)
+    assert [r[0] for r in results] == jobs
+    assert results[2][1:] == (1, 'RuntimeError: boom')
+    assert [line.split(' - ', 2)[2] for line in lines] == [
+        '01 - a - Success!', '03 - b - Success!', '04 - c - RuntimeError: boom',
+        '05 - d - Success!']
+
+def test_job_ledger_resumes(tmp_path):
+    """Test that a reloaded ledger knows completed and failed jobs."""
+    filename = str(tmp_path / 'ledger.jsonl')
+    ledger = cd.JobLedger(filename)
+    ledger.record('01', 'ndfl', 'abc', 0, 'Success!', 100)
+    ledger.record('03', 'ndfl', 'abc', 1, 'Folder not found')
+    ledger.record('03', 'ndfl', 'abc', 1, 'Form not loaded')
+    reloaded = cd.JobLedger(filename)
+    assert reloaded.is_complete('01', 'ndfl', 'abc')
+    assert not reloaded.is_complete('01', 'ndfl', 'changed')
+    assert not reloaded.is_complete('03', 'ndfl', 'abc')
+    [failure] = reloaded.failures()
+    assert failure['attempts'] == 2
+    assert failure['error'] == 'Form not loaded'
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'rosstat')
+
+@pytest.fixture
+def rosstat_server():
+    """Serve recorded rosstat pages from a local stand-in server."""
+    posted = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, fixture):
+            with open(os.path.join(FIXTURES, fixture), 'rb') as page:
+                body = page.read()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._send('region.html')
+
+        def do_POST(self):
+            length = int(self.headers['Content-Length'])
+            fields = parse_qsl(self.rfile.read(length).decode('ascii'),
+                               encoding='cp1251')
+            posted.append(fields)
+            names = [name for name, _ in fields]
+            self._send('table.html' if 'STbl' in names else 'form.html')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_port}/munst{{ok2}}/DBInet.cgi'
+    yield url, posted
+    server.shutdown()
+
+def test_http_backend_download(rosstat_server):
+    """Test that the HTTP backend submits the forms like a browser."""
+    url, posted = rosstat_server
+
+    async def fetch():
+        async with cd.async_backend.AsyncHttpSession(url_template=url) as s:
+            return await cd.async_backend.download(s, 'street_network', '01')
+
+    code, html = asyncio.run(fetch())
+    assert code == 0
+    assert 'Поселение 1' in html and 'OutTbl' not in html
+    region_post, form_post = posted
+    assert ('p8006007', 'on') in region_post
+    assert ('Knopka', 'Выбрать') in region_post
+    assert [v for k, v in form_post if k == 'munr'] == ['m1', 'm2']
+    assert [v for k, v in form_post if k == 'god'] == ['y2010']
+    assert [v for k, v in form_post if k == 'period'] == ['p1']
+    assert ('Layout', 'Manual') in form_post
+    assert ('_god', '1') in form_post and ('_munr', '2') in form_post
+    assert [v for k, v in form_post if k == 'a_oktmo'] == ['3']
+
+def test_async_backend_download(rosstat_server):
+    """Test concurrent downloads over the asyncio backend."""
+    url, posted = rosstat_server
+
+    async def crawl():
+        async with cd.async_backend.AsyncHttpSession(url_template=url) as s:
+
+            async def worker(job):
+                return await cd.async_backend.download(s, job[1], job[0])
+
+            jobs = [('01', 'street_network'), ('03', 'street_network'),
+                    ('40', 'street_network')]
+            return await cd.async_backend.run_jobs(jobs, worker,
+                                                   report=lambda x: None)
+
+    results = asyncio.run(crawl())
+    assert [r[1] for r in results] == [0, 0, 2]
+    assert 'Поселение 1' in results[0][2]
+    assert len(posted) == 4
+
+def test_http_backend_in_event_loop(tmp_path):
+    """Test that the sync http backend refuses to nest event loops."""
+
+    async def crawl():
+        cd.download_jobs([('01', 'street_network')], str(tmp_path),
+                         backend='http')
+
+    with pytest.raises(RuntimeError, match='download_all_async'):
+        asyncio.run(crawl())
+
+def test_template_registry_refresh(monkeypatch):
+    """Test that the registry is only recompiled when forced or changed."""
+    cd.templates.refresh()
+    assert not cd.templates.refresh()
+    # a new mtime with the same content doesn't recompile
+    mtime, size = cd.templates._config_stat()
+    monkeypatch.setattr(cd.templates, '_config_stat',
+                        lambda: (mtime + 1, size))
+    assert not cd.templates.refresh()
+    assert cd.templates.refresh(force=True)
+    templ = cd.templates.get_template('street_network', '40')
+    templ['god'] = '1999'
+    assert cd.templates.get_template('street_network', '40')['god'] == '2010'
+
+def test_template_matrix():
+    """Test the read-only template matrix and its availability index."""
+    templ = cd.templates.lookup('street_network', '40')
+    with pytest.raises(TypeError):
+        templ['god'] = '1999'
+    with pytest.raises(AttributeError):
+        templ['period'].append('1999')
+    period = cd.templates.get_template('street_network', '40')['period']
+    assert isinstance(period, list)
+    period.append('1999')
+    assert '1999' not in cd.templates.lookup('street_network', '40')['period']
+    assert not cd.templates.is_available('street_network', '40')
+    assert cd.templates.is_available('street_network', '01')
+    assert not cd.templates.availability().loc['40', 'street_network']
+    assert ('01', 'street_network') in cd.templates.pairs('2010')
+    assert ('40', 'street_network') not in cd.templates.pairs()
+    with pytest.raises(ValueError):
+        cd.templates.is_available('street_network', '00')
+
+def test_retry_policy_classifies_failures():
+    """Test that transient failures are retried and permanent are not."""
+    exceptions = cd.retry.wd_exceptions
+    policy = cd.RetryPolicy(attempts=3, base_delay=0)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise exceptions.TimeoutException()
+        return 'ok'
+
+    assert policy.call(flaky) == 'ok'
+    calls.clear()
+
+    def missing():
+        calls.append(1)
+        raise exceptions.NoSuchElementException()
+
+    with pytest.raises(cd.retry.StageFailed) as failure:
+        policy.call(missing)
+    assert len(calls) == 1
+    assert failure.value.describe('Folder not found') == \
+        'Folder not found (permanent: NoSuchElementException)'
+
+def test_failure_summary():
+    """Test that failed jobs are grouped by stage error."""
+    results = [(('01', 'ndfl'), 0, 'Success!'),
+               (('03', 'ndfl'), 1, 'Form not loaded (transient: X)'),
+               (('04', 'ndfl'), 1, 'Form not loaded (permanent: Y)'),
+               (('05', 'ndfl'), 2, 'No data')]
+    assert cd.retry.failure_summary(results) == (
+        '2 jobs need attention:\n'
+        '  Form not loaded (2): 03_ndfl, 04_ndfl')
+    assert cd.retry.failure_summary(results[:1]) == ''
+
+def test_download_records_stage_timings(monkeypatch):
+    """Test that download() times its stages and reports alerts."""
+    downloader = cd.downloader
+    for stage in ['_load_region', '_open_folder', '_check_indicator',
+                  '_open_form', '_fill_form', '_manual_layout']:
+        monkeypatch.setattr(downloader, stage, lambda *args: None)
+
+    def alert(driver, timeout):
+        raise cd.retry.wd_exceptions.UnexpectedAlertPresentException()
+
+    monkeypatch.setattr(downloader, '_launch_table', alert)
+    timings = {}
+    sink = cd.metrics.MemorySink()
+    cd.metrics.add_sink(sink)
+    try:
+        code, message = cd.download(None, 'street_network', '01',
+                                    timings=timings)
+        monkeypatch.setattr(downloader, '_launch_table', lambda *args: None)
+        monkeypatch.setattr(downloader, '_extract_table',
+                            lambda *args: '<tr></tr>')
+        assert cd.download(None, 'street_network', '01') == (0, '<tr></tr>')
+    finally:
+        cd.metrics.remove_sink(sink)
+    assert code == 1
+    assert message.startswith('Alert prevented table from loading')
+    assert list(timings)[-1] == 'launch_table'
+    assert 'extract_table' not in timings
+    sizes = [(x['stage'], x['bytes']) for x in sink.events]
+    assert sizes[5:7] == [('manual_layout', 0), ('launch_table', None)]
+    assert sizes[-1] == ('extract_table', 9)
+
+def test_metrics_sinks(tmp_path):
+    """Test that timing events reach every sink and are summarized."""
+    memory = cd.metrics.MemorySink()
+    jsonl = cd.metrics.JsonlSink(str(tmp_path / 'events.jsonl'))
+    prometheus = cd.metrics.PrometheusSink(str(tmp_path / 'crawl.prom'))
+    for sink in [memory, jsonl, prometheus]:
+        cd.metrics.add_sink(sink)
+    try:
+        for duration in [1.0, 2.0, 3.0]:
+            cd.metrics.emit('open_form', '01', 'ndfl', duration, 10)
+        with pytest.raises(KeyError):
+            with cd.metrics.timed('extract_table', '03', 'ndfl'):
+                raise KeyError
+    finally:
+        for sink in [memory, jsonl, prometheus]:
+            cd.metrics.remove_sink(sink)
+    prometheus.flush()
+    assert len(cd.metrics.read_events(jsonl.filename)) == 4
+    report = memory.report('stage')
+    assert report.loc['open_form', 'p50'] == 2.0
+    assert report.loc['open_form', 'bytes'] == 30
+    assert report.loc['extract_table', 'errors'] == 1
+    with open(prometheus.filename) as text_file:
+        text = text_file.read()
+    assert ('census2010_stage_duration_seconds_count{stage="open_form",'
+            'region="01",outcome="ok"} 3') in text
+
+def test_table_cache(tmp_path):
+    """Test that cached tables are found by template and deduplicated."""
+    cache = cd.TableCache(str(tmp_path / 'cache'))
+    first = cache.put('01', 'ndfl', 'abc', '<tr><td>1</td></tr>')
+    assert first['changed']
+    again = cache.put('01', 'ndfl', 'abc', '<tr><td>1</td></tr>')
+    assert not again['changed']
+    cache.put('03', 'ndfl', 'abc', '<tr><td>1</td></tr>')
+    reloaded = cd.TableCache(str(tmp_path / 'cache'))
+    assert reloaded.lookup('01', 'ndfl', 'abc')['size'] == 19
+    assert reloaded.lookup('01', 'ndfl', 'changed') is None
+    assert reloaded.read('03', 'ndfl') == '<tr><td>1</td></tr>'
+    assert len(list((tmp_path / 'cache' / 'objects').rglob('*.html'))) == 1
+
+def test_crawl_plan(tmp_path):
+    """Test job enumeration, cost estimates and sharding of a plan."""
+    events = [{'stage': 'launch_table', 'region': '01',
+               'indicator': 'street_network', 'duration': 3.0,
+               'outcome': 'ok'},
+              {'stage': 'format_html', 'region': '01',
+               'indicator': 'street_network', 'duration': 100.0,
+               'outcome': 'ok'}]
+    jobs = cd.plan.plan(regions=['01', '03', '40'],
+                        indicators=['street_network'], events=events)
+    assert jobs.run.tolist() == [True, True, False]
+    assert jobs.estimate.tolist() == [3.0, 3.0, 0.0]
+    report = cd.plan.summary(jobs, by='host')
+    assert report.index.tolist() == ['rosstat.gov.ru/munst01',
+                                     'rosstat.gov.ru/munst03',
+                                     'rosstat.gov.ru/munst40']
+    assert report.loc['rosstat.gov.ru/munst01'].tolist() == [1, 0, 0, 1, 3.0]
+    assert report.sum().tolist() == [3, 1, 0, 2, 6.0]
+    shards = cd.plan.shard(jobs, 2)
+    assert sorted(shards) == [[('01', 'street_network')],
+                              [('03', 'street_network')]]
+    cd.plan.save_shard(shards[0], str(tmp_path / 'shard.json'))
+    assert cd.plan.load_shard(str(tmp_path / 'shard.json')) == shards[0]
+
+def test_crawl_plan_repeated_runs():
+    """Test that repeated runs of a job don't add up in its estimate."""
+    events = []
+    for duration in [3.0, 3.0, 4.0]:
+        events += [{'stage': 'load_region', 'region': '01',
+                    'indicator': 'street_network', 'duration': 1.0,
+                    'outcome': 'ok'},
+                   {'stage': 'launch_table', 'region': '01',
+                    'indicator': 'street_network', 'duration': duration - 1,
+                    'outcome': 'ok'}]
+    events += [{'stage': 'load_region', 'region': '01',
+                'indicator': 'street_network', 'duration': 60.0,
+                'outcome': 'TimeoutException'}]
+    jobs = cd.plan.plan(regions=['01'], indicators=['street_network'],
+                        events=events)
+    assert jobs.estimate.tolist() == [3.0]
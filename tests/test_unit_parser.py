@@ -1,3 +1,157 @@
 """
 Unit test suite for Parser sub-package.
-"""
\ No newline at end of file
+"""
+
+import numpy as np
+import pandas as pd
+
+import census2010.downloader.post_process as pp
+from census2010.utils import read_table, read_table_metadata
+
+
+TABLE = ('<tr><td class="TblHdr">Муниципалитет</td><td>2010</td></tr>'
+         '<tr><td class="TblBok"><span class="bL0">Район 1</span></td>'
+         '<td>12,5</td><td>&nbsp;</td></tr>'
+         '<tr><td class="TblBok bL2">Поселение 1</td><td>-</td></tr>')
+
+
+def test_import_html(tmp_path):
+    """Test that data rows are imported into `d{x}` columns by muni."""
+    filename = str(tmp_path / '01_ndfl.html')
+    with open(filename, 'w') as html_file:
+        html_file.write(TABLE)
+    df = pp._import_html(filename)
+    assert list(df.index) == ['Район 1', 'Поселение 1']
+    assert list(df.columns) == ['d1', 'd2']
+    assert df.values.tolist() == [['12,5', '\xa0'], ['-', '']]
+
+def test_html_folder_to_csv_folder(tmp_path):
+    """Test parallel conversion, error reporting and up-to-date skips."""
+    html_dir, csv_dir = tmp_path / 'html', tmp_path / 'csv'
+    html_dir.mkdir()
+    (html_dir / '01_ndfl.html').write_text(TABLE)
+    (html_dir / '03_ndfl.html').write_text('<p>no table</p>')
+    (html_dir / '04_ndfl.html').write_text(TABLE)
+    results = pp.html_folder_to_csv_folder(str(html_dir), str(csv_dir),
+                                           workers=2)
+    assert [(r[0], r[1]) for r in results] == [
+        ('01_ndfl.html', 0), ('03_ndfl.html', 1), ('04_ndfl.html', 0)]
+    assert sorted(x.name for x in csv_dir.iterdir()) == [
+        '01_ndfl.csv', '04_ndfl.csv']
+    rerun = pp.html_folder_to_csv_folder(str(html_dir), str(csv_dir),
+                                         workers=1)
+    assert [r[1] for r in rerun] == [2, 1, 2]
+
+def test_html_folder_to_csv_folder_reports(tmp_path):
+    """Test that worker metrics and unparsed cell notes reach the parent."""
+    html_dir = tmp_path / 'html'
+    html_dir.mkdir()
+    (html_dir / '01_ndfl.html').write_text(
+        TABLE.replace('12,5', '71)'))
+    (html_dir / '03_ndfl.html').write_text(TABLE)
+    sink = pp.metrics.MemorySink()
+    pp.metrics.add_sink(sink)
+    try:
+        results = pp.html_folder_to_csv_folder(
+            str(html_dir), str(tmp_path / 'csv'), workers=2, force=True)
+    finally:
+        pp.metrics.remove_sink(sink)
+    assert results[0][2].startswith('converted, 1 cells could not be')
+    assert results[1][2] == 'converted'
+    stages = [(x['region'], x['stage']) for x in sink.events]
+    assert stages.count(('01', 'import_html')) == 1
+    assert stages.count(('03', 'write_table')) == 1
+
+def test_df_to_numeric():
+    """Test decimal commas, separators, markers, footnotes and bad cells."""
+    df = pd.DataFrame({'d1': ['12,5', '', '-', '1\xa0234,5', '7 1)', 'x']},
+                      index=pd.Index(list('abcdef'), name='muni'))
+    dfn = pp._df_to_numeric(df)
+    assert dfn.d1.tolist()[:5] == [12.5, 0, 0, 1234.5, 7]
+    assert np.isnan(dfn.d1.iloc[5])
+    assert dfn.attrs['unparsed'] == [('f', 'd1', 'x')]
+
+def test_df_to_numeric_footnote_digits():
+    """Test that a footnote glued to a value doesn't eat its digits."""
+    df = pd.DataFrame({'d1': ['71)', '12,51)', '12,5 1)', '3 12)']},
+                      index=pd.Index(list('abcd'), name='muni'))
+    dfn = pp._df_to_numeric(df)
+    assert dfn.d1.tolist()[2:] == [12.5, 3]
+    assert dfn.d1.iloc[:2].isna().all()
+    assert dfn.attrs['unparsed'] == [('a', 'd1', '71)'),
+                                     ('b', 'd1', '12,51)')]
+
+def test_delete_empty_rows():
+    """Test that empty rows and footer notes are dropped."""
+    df = pd.DataFrame({'d1': ['1', '', ' ', '', '2'], 'd2': [''] * 5},
+                      index=pd.Index(['a', 'b', 'c', '1) Данные за 2011 г.',
+                                      'Примечание: оценка'], name='muni'))
+    assert list(pp._delete_empty_rows(df).index) == ['a', 'c']
+
+def test_html_to_table_formats(tmp_path):
+    """Test that tables round-trip through every format with metadata."""
+    filename = str(tmp_path / '01_street_network.html')
+    with open(filename, 'w') as html_file:
+        html_file.write(TABLE)
+    frames = []
+    for ext in ['csv', 'parquet', 'feather']:
+        out_filename = str(tmp_path / f'01_street_network.{ext}')
+        pp.html_to_table(filename, out_filename)
+        frames.append(read_table(out_filename))
+        if ext != 'csv':
+            assert read_table_metadata(out_filename) == {
+                'region': '01', 'indicator': 'street_network',
+                'year': '2010'}
+    for df in frames:
+        assert df.columns.tolist() == ['muni', 'd1', 'd2']
+        assert df.d1.tolist() == [12.5, 0.0]
+
+def test_html_to_csv_any_name(tmp_path):
+    """Test that html_to_csv writes a csv whatever the file extension."""
+    filename = str(tmp_path / '01_street_network.html')
+    with open(filename, 'w') as html_file:
+        html_file.write(TABLE)
+    out_filename = str(tmp_path / 'out.txt')
+    pp.html_to_csv(filename, out_filename)
+    df = pd.read_csv(out_filename, sep=';')
+    assert df.columns.tolist() == ['muni', 'd1', 'd2']
+    assert df.d1.tolist() == [12.5, 0.0]
+
+def test_data_point_counts(tmp_path):
+    """Test that numeric rows are counted and counts are cached."""
+    filename = tmp_path / '01_street_network.html'
+    filename.write_text(TABLE + '<TR><TD>&nbsp;<b>3</b></TD></TR>')
+    assert pp._get_num_of_data_points(str(filename)) == 3
+    counts = pp._data_point_counts(str(tmp_path), ['01_street_network.html'])
+    assert counts == ({'01_street_network.html': 3}, True)
+    assert (tmp_path / pp.DATA_POINTS_CACHE).is_file()
+    counts = pp._data_point_counts(str(tmp_path), ['01_street_network.html'])
+    assert counts == ({'01_street_network.html': 3}, False)
+
+def test_extract_metadata(tmp_path):
+    """Test the availability report and that it is cached."""
+    for name in ['01_street_network', '01_doctors', '03_street_network']:
+        (tmp_path / f'{name}.html').write_text(TABLE)
+    report = pp.extract_metadata(str(tmp_path), workers=2)
+    assert report.columns.tolist() == ['str', 'doct']
+    assert report.loc['01'].tolist() == [2, 2]
+    assert report.loc['03'].tolist() == [2, '-']
+    assert all(isinstance(x, int) for x in report.loc['01'].tolist())
+    assert str(pd.read_parquet(tmp_path / pp.METADATA_REPORT).str.dtype) == 'Int64'
+    assert (tmp_path / pp.METADATA_REPORT).is_file()
+    (tmp_path / '03_doctors.html').write_text('<tr><td>-</td></tr>')
+    report = pp.extract_metadata(str(tmp_path), workers=1)
+    assert report.loc['03'].tolist() == [2, 0]
+
+def test_format_folder(tmp_path):
+    """Test that formatting is idempotent and matches on the fly output."""
+    filename = tmp_path / '01_street_network.html'
+    filename.write_text(TABLE)
+    expected = pp.HTML_HEADER + TABLE + pp.HTML_FOOTER
+    assert ''.join(pp.formatted_html(str(filename))) == expected
+    assert pp.format_folder(str(tmp_path), workers=2) == [
+        ('01_street_network.html', 0, 'formatted')]
+    assert pp.format_folder(str(tmp_path), workers=1) == [
+        ('01_street_network.html', 2, 'already formatted')]
+    assert filename.read_text() == expected
+    assert ''.join(pp.formatted_html(str(filename), 16)) == expected
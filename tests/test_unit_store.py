@@ -0,0 +1,32 @@
+"""
+Unit test suite for the dataset store.
+"""
+
+import numpy as np
+import pandas as pd
+
+from census2010.store import DatasetStore
+from census2010.utils import write_table
+
+
+def test_dataset_store(tmp_path):
+    """Test that tables round-trip through the store and can be sliced."""
+    df = pd.DataFrame({'muni': ['Район 1 (01602000)', 'Поселение 1'],
+                       'd1': [12.5, np.nan], 'd2': [1.0, 2.0]})
+    write_table(df, str(tmp_path / '01_street_network.parquet'),
+                {'region': '01', 'indicator': 'street_network',
+                 'year': '2010'})
+    write_table(df, str(tmp_path / '03_street_network.csv'))
+    with DatasetStore(str(tmp_path / 'census2010.sqlite')) as store:
+        assert store.add_folder(str(tmp_path)) == 2
+        assert store.pairs() == [('01', 'street_network'),
+                                 ('03', 'street_network')]
+        pd.testing.assert_frame_equal(store.table('01', 'street_network'),
+                                      df)
+        d1 = store.query(indicator='street_network', series='d1')
+        assert d1.region.tolist() == ['01', '01', '03', '03']
+        assert d1.oktmo[0] == '01602000' and pd.isna(d1.oktmo[1])
+        assert d1.year.tolist()[0] == '2010'
+        # adding a pair again replaces it
+        store.add_table(df.head(1), '01', 'street_network', '2010')
+        assert len(store.query('01', 'street_network')) == 2